@@ -0,0 +1,156 @@
+"""
+Analysis result cache
+Content-addressed cache for letter analyses with an in-process LRU tier
+and a MongoDB TTL tier shared across workers
+"""
+
+import os
+import re
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Any, Tuple
+
+from models import analysis_cache_collection
+
+logger = logging.getLogger(__name__)
+
+# Cache settings
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+ANALYSIS_CACHE_LRU_SIZE = int(os.getenv("ANALYSIS_CACHE_LRU_SIZE", "512"))
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Bump when the prompt or response format changes so stale analyses are not served
+ANALYSIS_CACHE_VERSION = "v2"
+
+_whitespace_re = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """Normalize extracted letter text so equivalent inputs share a cache key"""
+    return _whitespace_re.sub(" ", text).strip()
+
+def make_cache_key(text: str, language: str, scope: str = "") -> str:
+    """Build the content address for a letter text and response language
+
+    scope keeps answers that must not be shared (e.g. from a user's own keys)
+    apart; the shared cache uses none, so its keys are unchanged.
+    """
+    payload = f"{ANALYSIS_CACHE_VERSION}\0{language}\0{normalize_text(text)}"
+    if scope:
+        payload = f"{scope}\0{payload}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class AnalysisCache:
+    """Two-tier cache of analysis responses keyed by content hash"""
+
+    def __init__(self, collection, max_entries: int, ttl_seconds: int, enabled: bool = True):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.memory_hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.stores = 0
+        self.errors = 0
+
+    async def ensure_indexes(self):
+        """Create the TTL index that expires shared cache entries"""
+        if not self.enabled:
+            return
+        try:
+            await self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+        except Exception as e:
+            logger.error(f"Failed to create analysis cache indexes: {e}")
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: Dict[str, Any]):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached response, checking the local tier before MongoDB"""
+        if not self.enabled:
+            return None
+
+        value = self._get_local(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+
+        try:
+            doc = await self.collection.find_one({"_id": key}, {"response": 1, "created_at": 1})
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Analysis cache lookup failed: {e}")
+            doc = None
+
+        if doc and (datetime.utcnow() - doc["created_at"]).total_seconds() < self.ttl_seconds:
+            self.mongo_hits += 1
+            self._set_local(key, doc["response"])
+            return doc["response"]
+
+        self.misses += 1
+        return None
+
+    def record_bypass(self):
+        """Count a request that skipped the lookup on the client's request"""
+        self.bypasses += 1
+
+    async def set(self, key: str, value: Dict[str, Any], language: str):
+        """Store a response in both tiers"""
+        if not self.enabled:
+            return
+
+        self._set_local(key, value)
+        self.stores += 1
+        try:
+            await self.collection.replace_one(
+                {"_id": key},
+                {"_id": key, "language": language, "response": value, "created_at": datetime.utcnow()},
+                upsert=True
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Analysis cache store failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters"""
+        lookups = self.memory_hits + self.mongo_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries_in_memory": len(self._entries),
+            "max_entries_in_memory": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "memory_hits": self.memory_hits,
+            "mongo_hits": self.mongo_hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "stores": self.stores,
+            "errors": self.errors,
+            "hit_rate": (self.memory_hits + self.mongo_hits) / lookups if lookups else 0.0
+        }
+
+# Global instance
+analysis_cache = AnalysisCache(
+    analysis_cache_collection,
+    max_entries=ANALYSIS_CACHE_LRU_SIZE,
+    ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS,
+    enabled=ANALYSIS_CACHE_ENABLED
+)
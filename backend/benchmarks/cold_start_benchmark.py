@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark
+Measures how long `import server` takes, which modules dominate it and
+whether any provider SDK is imported at startup, then times fresh uvicorn
+processes from spawn to the first successful /api/health response.
+
+Usage (from backend/):
+    python benchmarks/cold_start_benchmark.py --runs 5 --output benchmarks/results/cold_start.json
+    python benchmarks/cold_start_benchmark.py --check   # exit 1 if p50 exceeds --target
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import urllib.request
+from typing import Dict, List, Any, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from pipeline_benchmark import summarize
+
+# Imported on a provider's first request, never at startup
+SDK_MODULES = ("google.ai.generativelanguage", "google.generativeai", "openai", "anthropic", "cohere", "mistralai")
+
+IMPORT_SNIPPET = f"""
+import sys, time, json
+started = time.perf_counter()
+import server
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "sdks_imported": [name for name in {SDK_MODULES!r} if name in sys.modules]
+}}))
+"""
+
+def measure_import(top: int) -> Dict[str, Any]:
+    """Time `import server` in a fresh interpreter and list the slowest top-level imports"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SNIPPET],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+
+    # Lines look like "import time:  self [us] | cumulative | imported package";
+    # top-level imports have no indentation before the package name
+    modules = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, package = line[len("import time:"):].split("|")
+        if not package.startswith(" ") or package.startswith("  "):
+            continue
+        modules.append((package.strip(), int(cumulative) / 1_000_000))
+    modules.sort(key=lambda item: item[1], reverse=True)
+    result["slowest_modules"] = [{"module": name, "seconds": seconds} for name, seconds in modules[:top]]
+    return result
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def measure_cold_start(timeout: float) -> Optional[float]:
+    """Seconds from spawning uvicorn until /api/health answers, or None on timeout"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/api/health"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        return None
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="server cold starts to time")
+    parser.add_argument("--timeout", type=float, default=30.0, help="give up on a start after this many seconds")
+    parser.add_argument("--target", type=float, default=1.0, help="cold start target in seconds")
+    parser.add_argument("--top", type=int, default=15, help="slowest top-level imports to report")
+    parser.add_argument("--check", action="store_true", help="exit 1 if the p50 cold start misses the target")
+    parser.add_argument("--output", default=None, help="where to write the JSON results")
+    args = parser.parse_args()
+
+    imports = measure_import(args.top)
+    print(f"import server: {imports['seconds'] * 1000:.0f} ms")
+    print(f"provider SDKs imported at startup: {', '.join(imports['sdks_imported']) or 'none'}")
+    for entry in imports["slowest_modules"]:
+        print(f"  {entry['module']:40} {entry['seconds'] * 1000:8.1f} ms")
+
+    samples: List[float] = []
+    timeouts = 0
+    for _ in range(args.runs):
+        seconds = measure_cold_start(args.timeout)
+        if seconds is None:
+            timeouts += 1
+        else:
+            samples.append(seconds)
+    cold_start = summarize(samples)
+    cold_start["timeouts"] = timeouts
+    met = bool(samples) and cold_start["p50_ms"] <= args.target * 1000
+    print(
+        f"\ncold start to /api/health: p50 {cold_start.get('p50_ms', float('nan')):.0f} ms  "
+        f"max {cold_start.get('max_ms', float('nan')):.0f} ms  timeouts {timeouts}  "
+        f"(target {args.target * 1000:.0f} ms: {'met' if met else 'missed'})"
+    )
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "import": imports, "cold_start": cold_start, "target_met": met}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.check and not met:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark corpus
+Sample German letters rendered as PDFs and phone-photo-like images
+"""
+
+import os
+import glob
+import random
+from dataclasses import dataclass
+from typing import List
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+@dataclass
+class Letter:
+    name: str
+    text: str
+
+@dataclass
+class Document:
+    name: str
+    content_type: str
+    data: bytes
+    text: str  # ground truth
+
+def load_letters() -> List[Letter]:
+    """Load the sample letter texts"""
+    letters = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.txt"))):
+        with open(path, encoding="utf-8") as f:
+            letters.append(Letter(os.path.splitext(os.path.basename(path))[0], f.read()))
+    return letters
+
+def render_pdf(text: str, pages: int = 1) -> bytes:
+    """Render a letter as a text PDF, repeating it to fill the requested pages"""
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page(width=595, height=842)  # A4 in points
+        page.insert_textbox(fitz.Rect(56, 56, 539, 786), text, fontsize=9, fontname="helv")
+        page.insert_text((280, 815), f"Seite {number + 1} von {pages}", fontsize=8, fontname="helv")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def _load_font(size: int):
+    from PIL import ImageFont
+    for name in ("DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "Arial.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+def render_page_image(text: str, dpi: int = 300):
+    """Render a letter as a clean grayscale A4 page"""
+    from PIL import Image, ImageDraw
+
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    margin = int(0.8 * dpi)
+    font = _load_font(int(dpi / 8))
+    line_height = int(dpi / 8 * 1.35)
+
+    page = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    y = margin
+    for line in text.splitlines():
+        if y > height - margin:
+            break
+        draw.text((margin, y), line, fill=20, font=font)
+        y += line_height
+    return page
+
+def render_photo(text: str, seed: int = 0, megapixels: float = 12.0, skew_degrees: float = 3.0) -> bytes:
+    """Render a letter as a skewed, noisy JPEG of a page lying on a darker background"""
+    from io import BytesIO
+    from PIL import Image, ImageFilter
+
+    rng = random.Random(seed)
+    page = render_page_image(text).convert("RGB")
+
+    # Place the page on a table-coloured background at a slight angle
+    canvas_width = int((megapixels * 1_000_000 * 3 / 4) ** 0.5)  # portrait 3:4
+    canvas_height = int(canvas_width * 4 / 3)
+    background = Image.new("RGB", (canvas_width, canvas_height), (96, 78, 62))
+    scale = 0.8 * min(canvas_width / page.width, canvas_height / page.height)
+    page = page.resize((int(page.width * scale), int(page.height * scale)))
+    angle = rng.uniform(-skew_degrees, skew_degrees)
+    rotated = page.rotate(angle, expand=True, fillcolor=(96, 78, 62))
+    offset = ((canvas_width - rotated.width) // 2, (canvas_height - rotated.height) // 2)
+    background.paste(rotated, offset)
+
+    photo = background.filter(ImageFilter.GaussianBlur(0.8))
+    output = BytesIO()
+    photo.save(output, format="JPEG", quality=85)
+    return output.getvalue()
+
+def build_documents(pdf_pages: List[int] = (1, 20), photos: bool = True) -> List[Document]:
+    """Build the benchmark documents: PDFs of several lengths and photos of each letter"""
+    documents = []
+    for index, letter in enumerate(load_letters()):
+        for pages in pdf_pages:
+            documents.append(Document(
+                f"{letter.name}_{pages}p.pdf", "application/pdf", render_pdf(letter.text, pages), letter.text
+            ))
+        if photos:
+            documents.append(Document(
+                f"{letter.name}_photo.jpg", "image/jpeg", render_photo(letter.text, seed=index), letter.text
+            ))
+    return documents
@@ -0,0 +1,92 @@
+"""
+Stub LLM provider for offline benchmarks
+Answers with a canned analysis after a configurable latency and error rate
+"""
+
+import json
+import random
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from llm_manager import LLMProvider, ProviderConfig, ProviderStatus
+
+CANNED_ANALYSIS = {
+    "summary": "Invitation to a personal appointment at the Jobcenter.",
+    "sender": "Jobcenter Musterstadt",
+    "letter_type": "Jobcenter invitation",
+    "main_content": "You are invited to discuss your job search. Bring your ID and CV.",
+    "actions_needed": ["Attend the appointment", "Bring the listed documents"],
+    "deadlines": ["17.09.2024 09:30 - appointment at the Jobcenter"],
+    "documents_required": ["ID or residence permit", "CV", "Proof of applications"],
+    "consequences": "Missing the appointment without reason reduces your benefits by 10% for one month.",
+    "urgency_level": "HIGH",
+    "response_template": None
+}
+
+def fake_config(name: str, priority: int = 1, max_concurrency: int = 1000) -> ProviderConfig:
+    """Provider config with limits high enough that they never throttle a benchmark"""
+    return ProviderConfig(
+        name=name,
+        api_key="benchmark",
+        priority=priority,
+        status=ProviderStatus.ACTIVE,
+        max_requests_per_minute=10_000_000,
+        max_requests_per_day=10_000_000,
+        max_concurrency=max_concurrency,
+        current_requests_minute=0,
+        current_requests_day=0,
+        last_reset_minute=datetime.now(),
+        last_reset_day=datetime.now(),
+        error_count=0,
+        last_error=None,
+        last_success=None
+    )
+
+class FakeLLMProvider(LLMProvider):
+    """LLM provider that sleeps instead of calling an API"""
+
+    def __init__(
+        self,
+        config: ProviderConfig,
+        latency: float = 0.5,
+        jitter: float = 0.1,
+        error_rate: float = 0.0,
+        invalid_json_rate: float = 0.0,
+        chunk_size: int = 16,
+        seed: Optional[int] = None
+    ):
+        super().__init__(config)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.invalid_json_rate = invalid_json_rate
+        self.chunk_size = chunk_size
+        self.random = random.Random(seed)
+        self.response_text = "```json\n" + json.dumps(CANNED_ANALYSIS, ensure_ascii=False, indent=2) + "\n```"
+
+    def _delay(self) -> float:
+        return max(0.0, self.random.gauss(self.latency, self.jitter))
+
+    def _answer(self) -> str:
+        if self.random.random() < self.error_rate:
+            raise Exception(f"{self.name}: simulated provider error")
+        if self.random.random() < self.invalid_json_rate:
+            return "Sorry, I cannot help with that letter."
+        return self.response_text
+
+    async def generate_content(self, prompt: str, json_mode: bool = False) -> str:
+        await asyncio.sleep(self._delay())
+        return self._answer()
+
+    async def stream_content(self, prompt: str, json_mode: bool = False) -> AsyncIterator[str]:
+        # Spread the latency over the chunks, with a short time to first token
+        answer = self._answer()
+        chunks = [answer[i:i + self.chunk_size] for i in range(0, len(answer), self.chunk_size)]
+        per_chunk = self._delay() / max(1, len(chunks))
+        for chunk in chunks:
+            await asyncio.sleep(per_chunk)
+            yield chunk
+
+    def is_available(self) -> bool:
+        return True
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Login throughput benchmark
+Measures bcrypt verification throughput and event-loop lag for a range
+of work factors and password pool sizes, to size PASSWORD_HASH_WORKERS.
+
+Usage (from backend/):
+    python benchmarks/login_benchmark.py --rounds 10 12 --workers 1 2 4 8 --logins 64
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from auth import hash_password, verify_password
+from pipeline_benchmark import summarize
+
+async def measure_loop_lag(stop: asyncio.Event, samples: list, interval: float = 0.01):
+    """Record how late the event loop wakes up while logins are running"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+async def run_logins(rounds: int, workers: int, logins: int) -> Dict[str, Any]:
+    """Verify `logins` passwords concurrently through a pool of `workers` threads"""
+    password = "correct horse battery staple"
+    hashed = hash_password(password, rounds=rounds)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+    loop = asyncio.get_running_loop()
+    latencies, lag = [], []
+
+    async def login():
+        started = time.perf_counter()
+        assert await loop.run_in_executor(executor, verify_password, password, hashed)
+        latencies.append(time.perf_counter() - started)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop, lag))
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+    executor.shutdown()
+
+    return {
+        "rounds": rounds,
+        "workers": workers,
+        "logins": logins,
+        "logins_per_second": logins / elapsed,
+        "latency": summarize(latencies),
+        "loop_lag": summarize(lag)
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--logins", type=int, default=64, help="concurrent logins per run")
+    parser.add_argument("--output", default=None, help="where to write the JSON results")
+    args = parser.parse_args()
+
+    results = []
+    for rounds in args.rounds:
+        for workers in args.workers:
+            result = await run_logins(rounds, workers, args.logins)
+            results.append(result)
+            print(
+                f"rounds={rounds:2} workers={workers:2}  "
+                f"{result['logins_per_second']:7.1f} logins/s  "
+                f"p95 {result['latency']['p95_ms']:8.1f} ms  "
+                f"max loop lag {result['loop_lag'].get('max_ms', 0):6.1f} ms"
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"cpus": os.cpu_count(), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
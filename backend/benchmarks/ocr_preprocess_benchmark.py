@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+OCR preprocessing benchmark
+Runs Tesseract on synthetic phone photos of the corpus letters with
+different preprocessing steps enabled, and reports OCR time and
+character accuracy against the ground truth text. Also measures the
+fixed per-image cost of each OCR engine on a tiny image.
+
+Usage (from backend/, needs tesseract with the deu language pack):
+    python benchmarks/ocr_preprocess_benchmark.py --photos 2 --output benchmarks/results/ocr.json
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import difflib
+import argparse
+from typing import Dict, List, Any
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from extraction import recognize_text, _get_tesseract_api
+from ocr_preprocessing import PreprocessOptions, preprocess_image
+from corpus import load_letters, render_photo
+from pipeline_benchmark import summarize
+
+CONFIGURATIONS = {
+    "none": (),
+    "grayscale": ("grayscale",),
+    "grayscale+downscale": ("grayscale", "downscale"),
+    "grayscale+crop+downscale": ("grayscale", "crop", "downscale"),
+    "grayscale+crop+downscale+deskew": ("grayscale", "crop", "downscale", "deskew"),
+    "all": ("grayscale", "crop", "downscale", "deskew", "binarize")
+}
+
+def character_accuracy(expected: str, actual: str) -> float:
+    """Similarity of the two texts with whitespace normalized, from 0 to 1"""
+    return difflib.SequenceMatcher(None, " ".join(expected.split()), " ".join(actual.split()), autojunk=False).ratio()
+
+def engine_overhead(engine: str, iterations: int) -> Dict[str, float]:
+    """Time OCR of a tiny blank image, which is almost all fixed per-call cost"""
+    from PIL import Image
+
+    image = Image.new("L", (32, 32), 255)
+    recognize_text(image, engine)  # warm up: loads the engine once
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        recognize_text(image, engine)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+def run_configuration(photos: List[Dict[str, Any]], options: PreprocessOptions, engine: str) -> Dict[str, Any]:
+    from PIL import Image
+
+    preprocess_times, ocr_times, accuracies = [], [], []
+    for photo in photos:
+        started = time.perf_counter()
+        image = preprocess_image(Image.open(io.BytesIO(photo["data"])), options)
+        preprocessed = time.perf_counter()
+        text = recognize_text(image, engine)
+        finished = time.perf_counter()
+
+        preprocess_times.append(preprocessed - started)
+        ocr_times.append(finished - preprocessed)
+        accuracies.append(character_accuracy(photo["text"], text))
+
+    return {
+        "preprocess": summarize(preprocess_times),
+        "ocr": summarize(ocr_times),
+        "total_seconds": sum(preprocess_times) + sum(ocr_times),
+        "mean_accuracy": sum(accuracies) / len(accuracies)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=1, help="photos per letter, each with a different skew")
+    parser.add_argument("--megapixels", type=float, default=12.0)
+    parser.add_argument("--skew", type=float, default=3.0, help="maximum skew in degrees")
+    parser.add_argument("--target-dpi", type=int, default=300)
+    parser.add_argument("--engine", default="auto", choices=["auto", "pytesseract"],
+                        help="auto uses tesserocr when installed")
+    parser.add_argument("--overhead-iterations", type=int, default=20)
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGURATIONS), choices=list(CONFIGURATIONS))
+    parser.add_argument("--output", default=None, help="where to write the JSON results")
+    args = parser.parse_args()
+
+    photos = [
+        {"name": f"{letter.name}_{i}", "text": letter.text,
+         "data": render_photo(letter.text, seed=index * 100 + i, megapixels=args.megapixels, skew_degrees=args.skew)}
+        for index, letter in enumerate(load_letters())
+        for i in range(args.photos)
+    ]
+
+    engines = ["pytesseract"] + (["tesserocr"] if _get_tesseract_api() is not None else [])
+    overhead = {engine: engine_overhead(engine, args.overhead_iterations) for engine in engines}
+    for engine, result in overhead.items():
+        print(f"{engine:12} per-image overhead p50 {result['p50_ms']:8.1f} ms")
+    print()
+
+    base = PreprocessOptions(target_dpi=args.target_dpi)
+    results = {}
+    for name in args.configs:
+        result = run_configuration(photos, base.only(*CONFIGURATIONS[name]), args.engine)
+        results[name] = result
+        print(
+            f"{name:34} preprocess p50 {result['preprocess']['p50_ms']:8.1f} ms  "
+            f"ocr p50 {result['ocr']['p50_ms']:8.1f} ms  "
+            f"accuracy {result['mean_accuracy'] * 100:5.1f}%"
+        )
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"photos": len(photos), "config": vars(args), "engine_overhead": overhead, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
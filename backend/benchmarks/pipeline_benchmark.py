@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Offline pipeline benchmark
+Measures per-stage timings and end-to-end endpoint throughput on one
+machine, with stub LLM providers instead of real APIs.
+
+Usage (from backend/):
+    python benchmarks/pipeline_benchmark.py --output benchmarks/results/current.json
+    python benchmarks/pipeline_benchmark.py --compare benchmarks/results/baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Any, Callable, Awaitable
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Measure our own code: no shared cache, no coalescing of repeated letters, no background job workers
+os.environ.setdefault("ANALYSIS_CACHE_ENABLED", "false")
+os.environ.setdefault("SINGLE_FLIGHT_ENABLED", "false")
+os.environ.setdefault("JOB_WORKERS", "0")
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.mean(samples) * 1000,
+        "p50_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "max_ms": ordered[-1] * 1000
+    }
+
+async def time_async(fn: Callable[[], Awaitable[Any]], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def time_sync(fn: Callable[[], Any], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+async def benchmark_stages(server, documents, letters, iterations: int) -> Dict[str, Any]:
+    """Time each pipeline stage in isolation"""
+    from fake_provider import FakeLLMProvider, fake_config
+
+    stages: Dict[str, Any] = {}
+
+    for document in documents:
+        stage = "ocr" if document.content_type.startswith("image/") else "pdf_extraction"
+        try:
+            samples = await time_async(
+                lambda: server.extract_text_from_upload(document.data, document.content_type), iterations
+            )
+            stages.setdefault(stage, {})[document.name] = summarize(samples)
+        except Exception as e:
+            stages.setdefault(stage, {})[document.name] = {"error": str(getattr(e, "detail", e))}
+
+    stages["prompt_build"] = {
+        letter.name: summarize(time_sync(lambda: server.create_analysis_prompt(letter.text, "en"), iterations * 20))
+        for letter in letters
+    }
+
+    response_text = FakeLLMProvider(fake_config("stub")).response_text
+    stages["json_parse"] = summarize(time_sync(
+        lambda: server.parse_analysis_json(response_text), iterations * 20
+    ))
+
+    analysis_data, _ = server.parse_analysis_json(response_text)
+    stages["response_build"] = summarize(time_sync(
+        lambda: server.LetterAnalysisResponse(
+            analysis=analysis_data,
+            summary=analysis_data.get("summary", "Analysis completed"),
+            actions_needed=analysis_data.get("actions_needed", []),
+            deadlines=analysis_data.get("deadlines", []),
+            response_template=analysis_data.get("response_template"),
+            llm_provider="stub"
+        ).dict(),
+        iterations * 20
+    ))
+    return stages
+
+async def benchmark_endpoints(server, documents, letters, requests: int, concurrency: int) -> Dict[str, Any]:
+    """Drive the endpoints through the ASGI app and measure throughput"""
+    import httpx
+
+    transport = httpx.ASGITransport(app=server.app)
+    results: Dict[str, Any] = {}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+        def text_request(i):
+            letter = letters[i % len(letters)]
+            return client.post("/api/analyze-text", json={"text": letter.text, "language": "en"})
+
+        def stream_request(i):
+            letter = letters[i % len(letters)]
+            return client.post("/api/analyze-text/stream", json={"text": letter.text, "language": "en"})
+
+        def file_request(kind):
+            matching = [d for d in documents if d.content_type.startswith(kind)]
+            def send(i):
+                document = matching[i % len(matching)]
+                return client.post(
+                    "/api/analyze-file",
+                    files={"file": (document.name, document.data, document.content_type)},
+                    data={"language": "en"}
+                )
+            return send if matching else None
+
+        endpoints = {
+            "analyze_text": text_request,
+            "analyze_text_stream": stream_request,
+            "analyze_file_pdf": file_request("application/pdf"),
+            "analyze_file_image": file_request("image/")
+        }
+
+        for name, send in endpoints.items():
+            if send is None:
+                continue
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies, failures = [], 0
+
+            async def one(i):
+                nonlocal failures
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await send(i)
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        failures += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(requests)))
+            elapsed = time.perf_counter() - started
+            results[name] = {
+                "requests": requests,
+                "concurrency": concurrency,
+                "failures": failures,
+                "throughput_rps": requests / elapsed,
+                "latency": summarize(latencies)
+            }
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print the change in p50 latency and throughput against a baseline run"""
+    print(f"\nComparison: {baseline.get('commit')} -> {current.get('commit')}")
+    for name, result in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        for metric, now, then in (
+            ("throughput_rps", result["throughput_rps"], before["throughput_rps"]),
+            ("p50_ms", result["latency"]["p50_ms"], before["latency"]["p50_ms"])
+        ):
+            change = (now - then) / then * 100 if then else 0.0
+            print(f"  {name:22} {metric:15} {then:10.2f} -> {now:10.2f} ({change:+.1f}%)")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=None, help="where to write the JSON results")
+    parser.add_argument("--compare", default=None, help="baseline results JSON to compare against")
+    parser.add_argument("--iterations", type=int, default=5, help="iterations per stage measurement")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent requests per endpoint")
+    parser.add_argument("--providers", type=int, default=2, help="number of stub providers")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub provider mean latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub provider error rate")
+    parser.add_argument("--invalid-json-rate", type=float, default=0.0, help="stub provider invalid JSON rate")
+    parser.add_argument("--pdf-pages", type=int, nargs="+", default=[1, 20], help="PDF lengths to generate")
+    parser.add_argument("--no-photos", action="store_true", help="skip the OCR documents")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import server
+    from corpus import load_letters, build_documents
+    from fake_provider import FakeLLMProvider, fake_config
+
+    server.llm_manager.providers = [
+        FakeLLMProvider(
+            fake_config(f"stub{i}", priority=i + 1),
+            latency=args.latency,
+            error_rate=args.error_rate,
+            invalid_json_rate=args.invalid_json_rate,
+            seed=args.seed + i
+        )
+        for i in range(args.providers)
+    ]
+
+    letters = load_letters()
+    documents = build_documents(pdf_pages=args.pdf_pages, photos=not args.no_photos)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": vars(args),
+        "stages": await benchmark_stages(server, documents, letters, args.iterations),
+        "endpoints": await benchmark_endpoints(server, documents, letters, args.requests, args.concurrency)
+    }
+    server.extraction_pool.shutdown()
+
+    output = args.output or os.path.join(BACKEND_DIR, "benchmarks", "results", f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print(json.dumps(results["endpoints"], indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+User lookup benchmark
+Seeds a scratch database with up to 1M users and measures login and
+profile lookup latency as the collection grows. With the unique email
+and id indexes the latency should stay flat.
+
+Usage (from backend/, needs a MongoDB at MONGO_URL):
+    python benchmarks/user_lookup_benchmark.py --users 1000000 --lookups 2000
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from models import ensure_user_indexes, LOGIN_PROJECTION, PROFILE_PROJECTION
+from pipeline_benchmark import summarize
+
+USER_NAMESPACE = uuid.UUID("6f1c2a4e-8a57-4bb8-9a51-3d0b6f2f7a10")
+
+def user_doc(index: int) -> dict:
+    """Deterministic user document; the hash is a placeholder, no bcrypt needed"""
+    return {
+        "id": str(uuid.uuid5(USER_NAMESPACE, str(index))),
+        "email": f"user{index}@example.com",
+        "name": f"User {index}",
+        "password_hash": "$2b$12$" + "x" * 53,
+        "api_keys": {},
+        "created_at": datetime.utcnow(),
+        "last_login": None,
+        "is_active": True
+    }
+
+async def seed(collection, start: int, end: int, batch_size: int):
+    for batch_start in range(start, end, batch_size):
+        batch_end = min(end, batch_start + batch_size)
+        await collection.insert_many([user_doc(i) for i in range(batch_start, batch_end)], ordered=False)
+
+async def measure(collection, population: int, lookups: int, rng: random.Random) -> dict:
+    login, profile = [], []
+    for _ in range(lookups):
+        index = rng.randrange(population)
+
+        started = time.perf_counter()
+        assert await collection.find_one({"email": f"user{index}@example.com"}, LOGIN_PROJECTION)
+        login.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        assert await collection.find_one({"id": str(uuid.uuid5(USER_NAMESPACE, str(index)))}, PROFILE_PROJECTION)
+        profile.append(time.perf_counter() - started)
+
+    return {"users": population, "login_lookup": summarize(login), "profile_lookup": summarize(profile)}
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--database", default="german_letters_benchmark")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=2000, help="lookups per checkpoint")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch database afterwards")
+    parser.add_argument("--output", default=None, help="where to write the JSON results")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(args.mongo_url)
+    collection = client[args.database].users
+    await collection.drop()
+    await ensure_user_indexes(collection)
+
+    rng = random.Random(args.seed)
+    checkpoints = [n for n in (1_000, 10_000, 100_000, 1_000_000, 10_000_000) if n < args.users] + [args.users]
+    results, seeded = [], 0
+    try:
+        for population in checkpoints:
+            started = time.perf_counter()
+            await seed(collection, seeded, population, args.batch_size)
+            seeded = population
+            result = await measure(collection, population, args.lookups, rng)
+            result["seed_seconds"] = time.perf_counter() - started
+            results.append(result)
+            print(
+                f"{population:>10,} users  "
+                f"login p50 {result['login_lookup']['p50_ms']:6.2f} ms  p95 {result['login_lookup']['p95_ms']:6.2f} ms  "
+                f"profile p50 {result['profile_lookup']['p50_ms']:6.2f} ms  p95 {result['profile_lookup']['p95_ms']:6.2f} ms"
+            )
+    finally:
+        if not args.keep:
+            await client.drop_database(args.database)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
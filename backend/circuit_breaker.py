@@ -0,0 +1,122 @@
+"""
+Circuit breaker
+Stops sending requests to a failing LLM provider, retries it after an
+exponentially growing pause with a single probe request, and closes again
+once the probe succeeds
+"""
+
+import os
+import time
+import logging
+from collections import deque
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from metrics import CIRCUIT_STATE, CIRCUIT_TRANSITIONS
+
+logger = logging.getLogger(__name__)
+
+# Trip when at least this share of the recent calls failed...
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+# ...out of the last CIRCUIT_WINDOW, once there are CIRCUIT_MIN_CALLS of them
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+# First pause before probing; doubles on every failed probe up to the maximum
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_MAX_OPEN_SECONDS = float(os.getenv("CIRCUIT_MAX_OPEN_SECONDS", "600"))
+# A probe that never reports back (e.g. an abandoned stream) is given up after this long
+CIRCUIT_PROBE_TIMEOUT = float(os.getenv("CIRCUIT_PROBE_TIMEOUT", "120"))
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+# Gauge values, ordered by severity
+STATE_VALUES = {CircuitState.CLOSED: 0, CircuitState.HALF_OPEN: 1, CircuitState.OPEN: 2}
+
+class CircuitBreaker:
+    """Per-provider circuit breaker
+
+    pool tells the shared manager's breakers apart from those of managers
+    built from users' own keys; only the shared ones drive the state gauge.
+    """
+
+    def __init__(self, name: str, pool: str = "shared"):
+        self.name = name
+        self.pool = pool
+        self.state = CircuitState.CLOSED
+        self.outcomes = deque(maxlen=CIRCUIT_WINDOW)
+        self.trips = 0
+        self.open_until = 0.0
+        self.probe_started: Optional[float] = None
+
+    def _transition(self, state: CircuitState):
+        if state == self.state:
+            return
+        logger.log(
+            logging.WARNING if state == CircuitState.OPEN else logging.INFO,
+            f"Circuit for provider {self.name} ({self.pool}): {self.state.value} -> {state.value}"
+        )
+        CIRCUIT_TRANSITIONS.inc(provider=self.name, pool=self.pool, from_state=self.state.value, to_state=state.value)
+        if self.pool == "shared":
+            CIRCUIT_STATE.set(STATE_VALUES[state], provider=self.name)
+        self.state = state
+
+    def _open(self):
+        pause = min(CIRCUIT_OPEN_SECONDS * 2 ** self.trips, CIRCUIT_MAX_OPEN_SECONDS)
+        self.trips += 1
+        self.open_until = time.monotonic() + pause
+        self.probe_started = None
+        self.outcomes.clear()
+        self._transition(CircuitState.OPEN)
+
+    def allow_request(self) -> bool:
+        """Whether a request may go out now; in half-open state this claims the single probe"""
+        if self.state == CircuitState.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == CircuitState.OPEN:
+            if now < self.open_until:
+                return False
+            self._transition(CircuitState.HALF_OPEN)
+        elif self.probe_started is not None and now - self.probe_started < CIRCUIT_PROBE_TIMEOUT:
+            return False
+        self.probe_started = now
+        return True
+
+    def cancel_probe(self):
+        """Give back a probe that was claimed but never answered (skipped or cancelled)"""
+        if self.state == CircuitState.HALF_OPEN:
+            self.probe_started = None
+
+    def record_success(self):
+        if self.state == CircuitState.HALF_OPEN:
+            self.trips = 0
+            self.probe_started = None
+            self.outcomes.clear()
+            self._transition(CircuitState.CLOSED)
+            return
+        self.outcomes.append(True)
+
+    def record_failure(self):
+        if self.state == CircuitState.HALF_OPEN:
+            self._open()
+            return
+        if self.state == CircuitState.OPEN:
+            # A call started before the circuit opened; it doesn't extend the pause
+            return
+        self.outcomes.append(False)
+        failures = self.outcomes.count(False)
+        if len(self.outcomes) >= CIRCUIT_MIN_CALLS and failures / len(self.outcomes) >= CIRCUIT_ERROR_RATE:
+            self._open()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Breaker state for the status endpoint"""
+        return {
+            "state": self.state.value,
+            "recent_error_rate": round(self.outcomes.count(False) / len(self.outcomes), 3) if self.outcomes else 0.0,
+            "trips": self.trips,
+            "retry_in_seconds": round(max(0.0, self.open_until - time.monotonic()), 1)
+            if self.state == CircuitState.OPEN else 0.0
+        }
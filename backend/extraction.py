@@ -0,0 +1,271 @@
+"""
+Text extraction workers
+Runs OCR and PDF text extraction in a bounded process pool so uploads
+never block the event loop
+"""
+
+import os
+import io
+import math
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Any, Callable, List, Tuple
+
+from ocr_preprocessing import PreprocessOptions, preprocess_image
+from metrics import EXTRACTION_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Pool settings
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", str(OCR_WORKERS * 4)))
+OCR_TESSERACT_THREADS = int(os.getenv("OCR_TESSERACT_THREADS", "1"))
+
+# PDF extraction budgets
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "50"))
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "100000"))
+PDF_PAGES_PER_CHUNK = int(os.getenv("PDF_PAGES_PER_CHUNK", "4"))
+
+# Configure Tesseract for German language
+OCR_LANGUAGES = "deu+eng"
+OCR_PAGE_SEGMENTATION_MODE = 6  # single uniform block of text
+OCR_TESSERACT_CONFIG = rf'--oem 3 --psm {OCR_PAGE_SEGMENTATION_MODE} -l {OCR_LANGUAGES}'
+
+# "auto" keeps a loaded tesserocr engine per worker when the bindings are
+# installed and falls back to the pytesseract subprocess otherwise
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")
+
+# Image cleanup before OCR (OCR_PREPROCESS and per-step OCR_* switches)
+OCR_PREPROCESS_OPTIONS = PreprocessOptions.from_env()
+
+class ExtractionPoolBusy(Exception):
+    """Raised when the extraction queue is full"""
+    pass
+
+# Per-process Tesseract engine; None until loaded, False if unavailable
+_tesseract_api = None
+
+def _get_tesseract_api():
+    """Load the in-process Tesseract engine once per process, or return None"""
+    global _tesseract_api
+    if _tesseract_api is None:
+        _tesseract_api = False
+        if OCR_ENGINE in ("auto", "tesserocr"):
+            try:
+                from tesserocr import PyTessBaseAPI, OEM
+
+                kwargs = {"lang": OCR_LANGUAGES, "psm": OCR_PAGE_SEGMENTATION_MODE, "oem": OEM.DEFAULT}
+                if os.getenv("TESSDATA_PREFIX"):
+                    kwargs["path"] = os.getenv("TESSDATA_PREFIX")
+                _tesseract_api = PyTessBaseAPI(**kwargs)
+                logger.info(f"Loaded tesserocr engine in process {os.getpid()}")
+            except Exception as e:
+                log = logger.warning if OCR_ENGINE == "tesserocr" else logger.info
+                log(f"tesserocr unavailable, using pytesseract: {e}")
+    return _tesseract_api or None
+
+def _init_worker(tesseract_threads: int):
+    """Limit Tesseract's OpenMP threads and load the OCR engine before the first job"""
+    os.environ["OMP_THREAD_LIMIT"] = str(tesseract_threads)
+    _get_tesseract_api()
+
+def recognize_text(image, engine: Optional[str] = None) -> str:
+    """Run Tesseract on a PIL image with the loaded engine, or the subprocess as a fallback"""
+    api = _get_tesseract_api() if engine != "pytesseract" else None
+    if api is not None:
+        # Reuses the loaded traineddata; no subprocess and no temp files
+        try:
+            api.SetImage(image)
+            return api.GetUTF8Text().strip()
+        finally:
+            api.Clear()
+
+    import pytesseract
+    text = pytesseract.image_to_string(image, config=OCR_TESSERACT_CONFIG)
+    return text.strip()
+
+def _ocr_image(image_bytes: bytes) -> str:
+    """Extract text from image bytes (runs inside a worker process)"""
+    from PIL import Image
+
+    image = preprocess_image(Image.open(io.BytesIO(image_bytes)), OCR_PREPROCESS_OPTIONS)
+    return recognize_text(image)
+
+def _pdf_extract_pages(pdf_bytes: bytes, start: int, end: int, char_budget: int) -> Tuple[List[str], int]:
+    """Extract pages [start, end) with PyMuPDF (runs inside a worker process)
+
+    Returns the page texts and the total page count of the document.
+    Stops early once char_budget characters have been collected.
+    """
+    import fitz  # PyMuPDF
+
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        pages = []
+        chars = 0
+        for number in range(start, min(end, doc.page_count)):
+            page_text = doc.load_page(number).get_text()
+            pages.append(page_text)
+            chars += len(page_text)
+            if chars >= char_budget:
+                break
+        return pages, doc.page_count
+    finally:
+        doc.close()
+
+def _pdf_extract_pages_pypdf2(pdf_bytes: bytes, max_pages: int, char_budget: int) -> List[str]:
+    """Extract pages with PyPDF2 (runs inside a worker process)"""
+    import PyPDF2
+
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    pages = []
+    chars = 0
+    for page in pdf_reader.pages[:max_pages]:
+        page_text = page.extract_text() or ""
+        pages.append(page_text)
+        chars += len(page_text)
+        if chars >= char_budget:
+            break
+    return pages
+
+class ExtractionPool:
+    """Process pool with a bound on queued and running extraction jobs"""
+
+    def __init__(self, max_workers: int, max_queue: int, tesseract_threads: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.tesseract_threads = tesseract_threads
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.pending = 0
+        # Set whenever a job finishes, to wake callers waiting for room
+        self._room = asyncio.Event()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(self.tesseract_threads,)
+            )
+        return self._executor
+
+    @asynccontextmanager
+    async def slot(self, wait: bool = False):
+        """Admit one extraction job; if the queue is full, reject it or (wait=True) wait for room"""
+        if self.pending >= self.max_queue and not wait:
+            EXTRACTION_REJECTED.inc()
+            raise ExtractionPoolBusy(f"Extraction queue is full ({self.pending} jobs pending)")
+        while self.pending >= self.max_queue:
+            self._room.clear()
+            await self._room.wait()
+
+        self.pending += 1
+        try:
+            yield
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool for the next job
+            logger.error("Extraction process pool is broken, restarting it")
+            self.shutdown()
+            raise
+        finally:
+            self._job_done()
+
+    def _job_done(self):
+        self.pending -= 1
+        self._room.set()
+
+    def submit(self, fn: Callable, *args) -> "asyncio.Future":
+        """Schedule fn in a worker process; call inside an admitted slot"""
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._get_executor(), fn, *args)
+
+    def submit_extra(self, fn: Callable, *args) -> "asyncio.Future":
+        """Schedule another job for an already admitted request
+
+        Never rejected, but counted in the queue depth until it finishes, so
+        new requests see how much work is really queued.
+        """
+        self.pending += 1
+        future = self.submit(fn, *args)
+        future.add_done_callback(self._extra_done)
+        return future
+
+    def _extra_done(self, future: "asyncio.Future"):
+        self._job_done()
+
+    async def run(self, fn: Callable, *args, wait: bool = False) -> Any:
+        """Run fn in a worker process, rejecting the job if the queue is full unless wait is set"""
+        async with self.slot(wait):
+            return await self.submit(fn, *args)
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Global instance
+extraction_pool = ExtractionPool(
+    max_workers=OCR_WORKERS,
+    max_queue=OCR_MAX_QUEUE,
+    tesseract_threads=OCR_TESSERACT_THREADS
+)
+
+async def extract_image_text(image_bytes: bytes, wait: bool = False) -> str:
+    """Extract text from an image using OCR in the worker pool"""
+    return await extraction_pool.run(_ocr_image, image_bytes, wait=wait)
+
+async def _extract_pdf_pages(pdf_bytes: bytes) -> List[str]:
+    """Extract PDF pages in parallel chunks, in page order, within the budgets"""
+    # The first chunk also tells us how many pages there are
+    first_end = min(PDF_PAGES_PER_CHUNK, PDF_MAX_PAGES)
+    pages, page_count = await extraction_pool.submit(
+        _pdf_extract_pages, pdf_bytes, 0, first_end, PDF_MAX_CHARS
+    )
+    last_page = min(page_count, PDF_MAX_PAGES)
+    chars = sum(len(page) for page in pages)
+    if chars >= PDF_MAX_CHARS or first_end >= last_page:
+        return pages
+
+    # Fan the remaining pages out to at most one job per worker: every job
+    # gets its own pickled copy of the document and opens it again
+    remaining = last_page - first_end
+    chunk_size = max(PDF_PAGES_PER_CHUNK, math.ceil(remaining / extraction_pool.max_workers))
+    chunks = [
+        extraction_pool.submit_extra(
+            _pdf_extract_pages, pdf_bytes, start, min(start + chunk_size, last_page), PDF_MAX_CHARS - chars
+        )
+        for start in range(first_end, last_page, chunk_size)
+    ]
+    try:
+        for chunk in chunks:
+            chunk_pages, _ = await chunk
+            pages.extend(chunk_pages)
+            chars += sum(len(page) for page in chunk_pages)
+            if chars >= PDF_MAX_CHARS:
+                break
+    finally:
+        for chunk in chunks:
+            chunk.cancel()
+
+    return pages
+
+async def extract_pdf_text(pdf_bytes: bytes, wait: bool = False) -> str:
+    """Extract text from a PDF, stopping at PDF_MAX_PAGES or PDF_MAX_CHARS"""
+    async with extraction_pool.slot(wait):
+        try:
+            # Try with PyMuPDF first (better for complex PDFs)
+            pages = await _extract_pdf_pages(pdf_bytes)
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            logger.warning(f"PyMuPDF extraction failed, falling back to PyPDF2: {e}")
+            pages = await extraction_pool.submit(
+                _pdf_extract_pages_pypdf2, pdf_bytes, PDF_MAX_PAGES, PDF_MAX_CHARS
+            )
+
+    # Form feeds mark the page breaks the normalizer finds headers and footers by
+    return "\f".join(pages)[:PDF_MAX_CHARS].strip()
@@ -0,0 +1,209 @@
+"""
+Background analysis jobs
+MongoDB-backed job queue so long file analyses run outside the HTTP request
+"""
+
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Callable, Awaitable
+
+from pymongo import ReturnDocument
+
+from models import jobs_collection
+
+logger = logging.getLogger(__name__)
+
+# Job queue settings
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY_SECONDS = int(os.getenv("JOB_RETRY_DELAY_SECONDS", "10"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", str(24 * 3600)))
+JOB_MAX_FILE_BYTES = int(os.getenv("JOB_MAX_FILE_BYTES", str(15 * 1024 * 1024)))
+
+FINISHED_STATUSES = ("completed", "failed")
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying cannot help"""
+    pass
+
+class JobQueue:
+    """Job queue with leased claims so unfinished jobs are picked up again after a restart"""
+
+    def __init__(self, collection, workers: int):
+        self.collection = collection
+        self.workers = workers
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handler: Optional[Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._waiters: Dict[str, asyncio.Event] = {}
+
+    async def ensure_indexes(self):
+        """Create indexes used to claim jobs and expire finished ones"""
+        try:
+            await self.collection.create_index([("status", 1), ("available_at", 1)])
+            await self.collection.create_index([("status", 1), ("lease_expires_at", 1)])
+            await self.collection.create_index("finished_at", expireAfterSeconds=JOB_RESULT_TTL_SECONDS)
+        except Exception as e:
+            logger.error(f"Failed to create job indexes: {e}")
+
+    def start(self, handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]):
+        """Start the worker tasks in this process"""
+        self.handler = handler
+        for index in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(index)))
+        logger.info(f"Started {self.workers} job workers ({self.worker_id})")
+
+    async def stop(self):
+        """Stop the worker tasks; their leased jobs will be re-claimed later"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, payload: Dict[str, Any]) -> str:
+        """Store a new job and wake an idle worker"""
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        await self.collection.insert_one({
+            "_id": job_id,
+            "status": "queued",
+            "payload": payload,
+            "attempts": 0,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "available_at": now,
+            "updated_at": now
+        })
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job without its payload"""
+        return await self.collection.find_one({"_id": job_id}, {"payload": 0})
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Long-poll a job until it finishes or the timeout passes"""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            job = await self.get(job_id)
+            remaining = deadline - asyncio.get_running_loop().time()
+            if job is None or job["status"] in FINISHED_STATUSES:
+                self._waiters.pop(job_id, None)
+                return job
+            if remaining <= 0:
+                return job
+
+            # Jobs finished by this process wake us at once; others are seen on the next poll
+            waiter = self._waiters.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(waiter.wait(), min(remaining, JOB_POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest runnable job, including jobs whose lease expired"""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {"status": "running", "lease_expires_at": {"$lt": now}}
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "worker_id": self.worker_id,
+                    "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "started_at": now,
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                self._wakeup.clear()
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker {index} failed to claim a job: {e}")
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The lease expires and another worker picks the job up again
+                logger.error(f"Job worker {index} failed to record job {job['_id']}: {e}")
+
+    async def _heartbeat(self, job_id: str):
+        """Extend the lease while a job is still being worked on"""
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            await self.collection.update_one(
+                {"_id": job_id, "worker_id": self.worker_id, "status": "running"},
+                {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}}
+            )
+
+    async def _finish(self, job_id: str, update: Dict[str, Any]):
+        now = datetime.utcnow()
+        update.setdefault("$set", {}).update({"updated_at": now})
+        if update["$set"].get("status") in FINISHED_STATUSES:
+            update["$set"]["finished_at"] = now
+            update["$unset"] = {"payload": "", "lease_expires_at": ""}
+        await self.collection.update_one({"_id": job_id, "worker_id": self.worker_id}, update)
+
+        waiter = self._waiters.pop(job_id, None)
+        if waiter is not None:
+            waiter.set()
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id = job["_id"]
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            # Its workers keep dying (e.g. out of memory), so stop re-claiming it
+            await self._finish(job_id, {"$set": {"status": "failed", "error": "Job exceeded the maximum number of attempts"}})
+            return
+
+        logger.info(f"Running job {job_id} (attempt {job['attempts']})")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            result = await self.handler(job["payload"])
+            await self._finish(job_id, {"$set": {"status": "completed", "result": result, "error": None}})
+        except asyncio.CancelledError:
+            raise
+        except PermanentJobError as e:
+            logger.warning(f"Job {job_id} failed permanently: {e}")
+            await self._finish(job_id, {"$set": {"status": "failed", "error": str(e)}})
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            if job["attempts"] >= JOB_MAX_ATTEMPTS:
+                await self._finish(job_id, {"$set": {"status": "failed", "error": str(e)}})
+            else:
+                retry_at = datetime.utcnow() + timedelta(seconds=JOB_RETRY_DELAY_SECONDS * job["attempts"])
+                await self._finish(job_id, {"$set": {"status": "queued", "available_at": retry_at, "error": str(e)}})
+        finally:
+            heartbeat.cancel()
+
+# Global instance
+job_queue = JobQueue(jobs_collection, workers=JOB_WORKERS)
@@ -0,0 +1,136 @@
+"""
+Tolerant JSON parsing
+Extracts the JSON object from an LLM answer and repairs the usual damage:
+code fences, prose around the object, trailing commas, comments and
+output truncated at the token limit
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Tuple
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+_DANGLING_KEY_RE = re.compile(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*:?\s*$')
+_DANGLING_COLON_RE = re.compile(r':\s*$')
+_PARTIAL_LITERAL_RE = re.compile(r'([:,\[]\s*)(?!(?:true|false|null)$)[A-Za-z0-9.+\-]+$')
+
+class JSONRepairError(ValueError):
+    """Raised when no JSON object can be recovered from the text"""
+    pass
+
+def _candidate(text: str) -> str:
+    """The part of the answer that should hold the object"""
+    match = _FENCE_RE.search(text)
+    if match and "{" in match.group(1):
+        text = match.group(1)
+    start = text.find("{")
+    if start == -1:
+        raise JSONRepairError("No JSON object found in response")
+    return text[start:]
+
+def _repair(text: str) -> str:
+    """Rewrite a damaged JSON object into valid JSON
+
+    Walks the text once, tracking strings and open brackets. Drops
+    comments and trailing commas, stops at the end of the first complete
+    object, and closes anything left open by truncation.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = False
+    escaped = False
+    i = 0
+    length = len(text)
+
+    while i < length:
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif char == "\n":
+                char = "\\n"
+            out.append(char)
+            i += 1
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char == "/" and text.startswith("//", i):
+            newline = text.find("\n", i)
+            i = length if newline == -1 else newline
+            continue
+        elif char == "/" and text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = length if end == -1 else end + 2
+            continue
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            _strip_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(char)
+            i += 1
+            if not stack:
+                break
+            continue
+        out.append(char)
+        i += 1
+
+    if in_string:
+        if escaped:
+            out.pop()
+        out.append('"')
+    if stack:
+        _drop_incomplete_member(out, stack[-1] == "}")
+        while stack:
+            _strip_trailing_comma(out)
+            out.append(stack.pop())
+    return "".join(out)
+
+def _strip_trailing_comma(out: List[str]):
+    index = len(out) - 1
+    while index >= 0 and out[index].isspace():
+        index -= 1
+    if index >= 0 and out[index] == ",":
+        del out[index]
+
+def _drop_incomplete_member(out: List[str], in_object: bool):
+    """Remove what truncation left unfinished at the end of the text"""
+    text = "".join(out).rstrip()
+    # A literal such as `tru` or `12.` may be cut short; drop it
+    text = _PARTIAL_LITERAL_RE.sub(r"\1", text).rstrip()
+    if in_object:
+        # `"key"` or `"key":` with no value yet
+        text = _DANGLING_KEY_RE.sub(r"\1", text)
+    text = _DANGLING_COLON_RE.sub(": null", text)
+    out[:] = list(text)
+
+def parse_json_object(text: str) -> Tuple[Dict[str, Any], bool]:
+    """Parse the JSON object in an LLM answer
+
+    Returns the object and whether it needed repair. Raises JSONRepairError
+    if nothing usable is found.
+    """
+    if not text or not text.strip():
+        raise JSONRepairError("Empty response")
+
+    candidate = _candidate(text)
+    try:
+        value, _ = json.JSONDecoder().raw_decode(candidate)
+        if isinstance(value, dict):
+            return value, False
+    except json.JSONDecodeError:
+        pass
+
+    try:
+        value = json.loads(_repair(candidate))
+    except json.JSONDecodeError as e:
+        raise JSONRepairError(f"Could not repair JSON: {e}") from e
+    if not isinstance(value, dict):
+        raise JSONRepairError("Response is not a valid JSON object")
+    return value, True
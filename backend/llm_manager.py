@@ -5,18 +5,82 @@ Manages multiple LLM providers with automatic fallback and quota management
 
 import os
 import json
+import importlib.util
+import asyncio
+import hashlib
 import logging
+import math
 import time
-from typing import Dict, List, Optional, Any, Tuple
+from collections import deque, OrderedDict
+from typing import Dict, List, Optional, Any, Tuple, Callable, AsyncIterator
 from abc import ABC, abstractmethod
 from enum import Enum
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 
+import httpx
+
+from rate_limiter import per_minute_and_day
+from routing import ProviderRouter
+from circuit_breaker import CircuitBreaker, CircuitState
+from metrics import (
+    LLM_REQUEST_SECONDS, LLM_FALLBACK_DEPTH, LLM_PROMPT_TOKENS, LLM_CACHED_PROMPT_TOKENS,
+    USER_MANAGER_LOOKUPS, USER_MANAGER_EVICTIONS
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared HTTP connection pool settings
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+
+# Hedged request settings
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.9"))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "8"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+LLM_HEDGE_MAX_PARALLEL = int(os.getenv("LLM_HEDGE_MAX_PARALLEL", "2"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "100"))
+LLM_LATENCY_MIN_SAMPLES = int(os.getenv("LLM_LATENCY_MIN_SAMPLES", "10"))
+
+# Pool of per-user managers built from users' own API keys
+LLM_USER_POOL_SIZE = int(os.getenv("LLM_USER_POOL_SIZE", "256"))
+LLM_USER_POOL_IDLE_SECONDS = int(os.getenv("LLM_USER_POOL_IDLE_SECONDS", "1800"))
+
+# How long to wait for rate-limit room or a concurrency slot before falling back to the next provider
+LLM_RATE_LIMIT_MAX_WAIT = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT", "0.3"))
+
+# Structured output requests for providers with a JSON mode
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+GEMINI_MODEL = "models/gemini-1.5-flash"
+GEMINI_JSON_CONFIG = {"response_mime_type": "application/json"}
+JSON_PREFILL = "{"
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the process-wide async HTTP client shared by all providers"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE
+            )
+        )
+    return _http_client
+
+async def close_http_client():
+    """Close the shared HTTP client and its pooled connections"""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
 class ProviderStatus(Enum):
     ACTIVE = "active"
     QUOTA_EXCEEDED = "quota_exceeded"
@@ -38,6 +102,8 @@ class ProviderConfig:
     error_count: int
     last_error: Optional[str]
     last_success: Optional[datetime]
+    max_concurrency: int = 4
+    max_input_tokens: int = 8000
 
 class LLMProvider(ABC):
     """Abstract base class for LLM providers"""
@@ -45,12 +111,50 @@ class LLMProvider(ABC):
     def __init__(self, config: ProviderConfig):
         self.config = config
         self.name = config.name
+        self.latencies = deque(maxlen=LLM_LATENCY_WINDOW)
+        self.rate_limiter = per_minute_and_day(config.max_requests_per_minute, config.max_requests_per_day)
+        self.concurrency = asyncio.Semaphore(config.max_concurrency)
+        self.in_flight = 0
+        self.breaker = CircuitBreaker(config.name)
+        # Shared cross-process quota (quota_store.QuotaStore), or None to count per process
+        self.quota = None
+        self._client = None
+        
+    # Module the provider's SDK is imported from on first use; None if it needs none
+    sdk_module: Optional[str] = None
+    
+    @property
+    def client(self):
+        """SDK client, created (importing the SDK) on the first request"""
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+    
+    def _create_client(self):
+        return None
+    
+    def sdk_installed(self) -> bool:
+        """Check that the SDK can be imported, without importing it"""
+        if self.sdk_module is None:
+            return True
+        try:
+            return importlib.util.find_spec(self.sdk_module) is not None
+        except ModuleNotFoundError:
+            return False
         
     @abstractmethod
-    async def generate_content(self, prompt: str) -> str:
-        """Generate content using the LLM provider"""
+    async def generate_content(self, prompt: str, json_mode: bool = False) -> str:
+        """Generate content using the LLM provider
+        
+        json_mode asks for a JSON object where the provider supports it;
+        others ignore it and rely on the prompt.
+        """
         pass
     
+    async def stream_content(self, prompt: str, json_mode: bool = False) -> AsyncIterator[str]:
+        """Stream generated content in chunks; providers without streaming yield it whole"""
+        yield await self.generate_content(prompt, json_mode)
+    
     @abstractmethod
     def is_available(self) -> bool:
         """Check if provider is available"""
@@ -58,6 +162,45 @@ class LLMProvider(ABC):
     
     def can_make_request(self) -> bool:
         """Check if provider can make a request based on rate limits"""
+        return not self._quota_exhausted() and self.rate_limiter.wait_time() == 0
+    
+    def _quota_exhausted(self) -> bool:
+        return self.quota is not None and self.quota.exhausted(
+            self.name, self.config.max_requests_per_minute, self.config.max_requests_per_day
+        )
+    
+    async def acquire(self, timeout: float) -> bool:
+        """Wait up to timeout for a concurrency slot and room under the rate limit
+        
+        On success the caller holds a slot and must call record_request and
+        then release.
+        """
+        deadline = time.monotonic() + timeout
+        if self._quota_exhausted() or self.rate_limiter.wait_time() > timeout:
+            return False
+        try:
+            await asyncio.wait_for(self.concurrency.acquire(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        try:
+            token_ready = await self.rate_limiter.wait(max(0.0, deadline - time.monotonic()))
+        except BaseException:
+            # Cancelled while waiting for a token: the slot would otherwise be lost for good
+            self.concurrency.release()
+            raise
+        if not token_ready:
+            self.concurrency.release()
+            return False
+        self.in_flight += 1
+        return True
+    
+    def release(self):
+        """Give back a concurrency slot taken by acquire"""
+        self.in_flight -= 1
+        self.concurrency.release()
+    
+    def _roll_counters(self):
+        """Reset the informational request counters shown in the status endpoint"""
         now = datetime.now()
         
         # Reset minute counter
@@ -69,98 +212,152 @@ class LLMProvider(ABC):
         if now - self.config.last_reset_day >= timedelta(days=1):
             self.config.current_requests_day = 0
             self.config.last_reset_day = now
-            
-        # Check limits
-        if self.config.current_requests_minute >= self.config.max_requests_per_minute:
-            return False
-        if self.config.current_requests_day >= self.config.max_requests_per_day:
-            return False
-            
-        return True
     
     def record_request(self):
         """Record a request"""
+        self.rate_limiter.consume()
+        if self.quota is not None:
+            self.quota.record(self.name)
+            self._sync_usage()
+            return
+        self._roll_counters()
         self.config.current_requests_minute += 1
         self.config.current_requests_day += 1
         
+    def _sync_usage(self):
+        """Show the shared counts, which include other workers' requests, in the config counters"""
+        if self.quota is not None:
+            self.config.current_requests_minute = self.quota.used(self.name, "minute")
+            self.config.current_requests_day = self.quota.used(self.name, "day")
+        
+    def record_prompt_tokens(self, total: Optional[int], cached: Optional[int]):
+        """Record prompt token usage reported by the provider"""
+        if total:
+            LLM_PROMPT_TOKENS.inc(total, provider=self.name)
+        if cached:
+            LLM_CACHED_PROMPT_TOKENS.inc(cached, provider=self.name)
+        
+    def record_latency(self, seconds: float):
+        """Record the latency of a completed request"""
+        self.latencies.append(seconds)
+        
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Get a latency percentile over recent requests, or None without enough samples"""
+        if len(self.latencies) < LLM_LATENCY_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, math.ceil(percentile * len(ordered)) - 1))
+        return ordered[index]
+        
     def record_success(self):
         """Record a successful request"""
         self.config.last_success = datetime.now()
         self.config.error_count = 0
-        self.config.status = ProviderStatus.ACTIVE
+        self.breaker.record_success()
+        self._sync_status()
         
     def record_error(self, error: str):
         """Record an error"""
         self.config.error_count += 1
         self.config.last_error = error
+        self.breaker.record_failure()
+        self._sync_status()
         
-        if self.config.error_count >= 5:
-            self.config.status = ProviderStatus.ERROR
+    def _sync_status(self):
+        """Mirror the circuit breaker in the status shown to operators"""
+        if self.config.status in (ProviderStatus.ACTIVE, ProviderStatus.ERROR):
+            closed = self.breaker.state == CircuitState.CLOSED
+            self.config.status = ProviderStatus.ACTIVE if closed else ProviderStatus.ERROR
             
 class GeminiProvider(LLMProvider):
     """Google Gemini provider"""
     
-    def __init__(self, config: ProviderConfig):
-        super().__init__(config)
-        try:
-            import google.generativeai as genai
-            if config.api_key and config.api_key != "your_gemini_api_key_here":
-                genai.configure(api_key=config.api_key)
-                self.model = genai.GenerativeModel('gemini-1.5-flash')
-                self.genai = genai
-            else:
-                self.model = None
-                logger.warning("Gemini API key not configured")
-        except Exception as e:
-            logger.error(f"Failed to initialize Gemini: {e}")
-            self.model = None
+    sdk_module = "google.ai.generativelanguage"
+    
+    def _create_client(self):
+        """The API client google.generativeai wraps, with this provider's key
+        
+        No genai.configure: it is process-global, and each user's provider
+        needs its own key. Created on the first request, so the gRPC channel
+        belongs to the running event loop. The SDK talks gRPC and takes no
+        HTTP transport, so Gemini doesn't use the shared httpx pool.
+        """
+        from google.ai import generativelanguage as glm
+        from google.api_core.client_options import ClientOptions
+        return glm.GenerativeServiceAsyncClient(client_options=ClientOptions(api_key=self.config.api_key))
             
-    async def generate_content(self, prompt: str) -> str:
+    def _request(self, prompt: str, json_mode: bool):
+        from google.ai import generativelanguage as glm
+        request = {
+            "model": GEMINI_MODEL,
+            "contents": [glm.Content(role="user", parts=[glm.Part(text=prompt)])]
+        }
+        if json_mode:
+            request["generation_config"] = glm.GenerationConfig(**GEMINI_JSON_CONFIG)
+        return glm.GenerateContentRequest(**request)
+            
+    @staticmethod
+    def _text(response) -> str:
+        """Text of the first candidate, like the SDK's response.text"""
+        if not response.candidates:
+            return ""
+        return "".join(part.text for part in response.candidates[0].content.parts)
+            
+    async def generate_content(self, prompt: str, json_mode: bool = False) -> str:
         try:
-            if not self.model:
-                raise Exception("Gemini model not initialized")
-                
-            response = self.model.generate_content(prompt)
+            response = await self.client.generate_content(self._request(prompt, json_mode))
+            usage = getattr(response, "usage_metadata", None)
+            if usage is not None:
+                self.record_prompt_tokens(usage.prompt_token_count, getattr(usage, "cached_content_token_count", 0))
             
-            if not response.text or response.text.strip() == "":
+            text = self._text(response)
+            if not text or text.strip() == "":
                 raise Exception("Empty response from Gemini")
                 
-            return response.text.strip()
+            return text.strip()
             
         except Exception as e:
             logger.error(f"Gemini error: {e}")
             raise
             
+    async def stream_content(self, prompt: str, json_mode: bool = False) -> AsyncIterator[str]:
+        try:
+            response = await self.client.stream_generate_content(self._request(prompt, json_mode))
+            async for chunk in response:
+                text = self._text(chunk)
+                if text:
+                    yield text
+                    
+        except Exception as e:
+            logger.error(f"Gemini streaming error: {e}")
+            raise
+            
     def is_available(self) -> bool:
-        return self.model is not None and self.config.api_key and self.config.api_key not in ["your_gemini_api_key_here", ""]
+        return bool(self.config.api_key) and self.config.api_key != "your_gemini_api_key_here" and self.sdk_installed()
 
 class OpenAIProvider(LLMProvider):
     """OpenAI GPT provider"""
     
-    def __init__(self, config: ProviderConfig):
-        super().__init__(config)
-        try:
-            if config.api_key and config.api_key.startswith("sk-proj-"):
-                import openai
-                self.client = openai.OpenAI(api_key=config.api_key)
-            else:
-                self.client = None
-                logger.warning("OpenAI API key not configured properly")
-        except Exception as e:
-            logger.error(f"Failed to initialize OpenAI: {e}")
-            self.client = None
+    sdk_module = "openai"
+    
+    def _create_client(self):
+        import openai
+        return openai.AsyncOpenAI(
+            api_key=self.config.api_key,
+            http_client=get_http_client(),
+            timeout=LLM_TIMEOUT
+        )
             
-    async def generate_content(self, prompt: str) -> str:
+    async def generate_content(self, prompt: str, json_mode: bool = False) -> str:
         try:
-            if not self.client:
-                raise Exception("OpenAI client not initialized")
-                
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=2000,
-                temperature=0.7
+                temperature=0.7,
+                **({"response_format": JSON_RESPONSE_FORMAT} if json_mode else {})
             )
+            self._record_usage(response.usage)
             
             return response.choices[0].message.content.strip()
             
@@ -168,70 +365,124 @@ class OpenAIProvider(LLMProvider):
             logger.error(f"OpenAI error: {e}")
             raise
             
+    async def stream_content(self, prompt: str, json_mode: bool = False) -> AsyncIterator[str]:
+        try:
+            stream = await self.client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=2000,
+                temperature=0.7,
+                stream=True,
+                stream_options={"include_usage": True},
+                **({"response_format": JSON_RESPONSE_FORMAT} if json_mode else {})
+            )
+            async for chunk in stream:
+                if chunk.usage:
+                    self._record_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                    
+        except Exception as e:
+            logger.error(f"OpenAI streaming error: {e}")
+            raise
+            
+    def _record_usage(self, usage):
+        """OpenAI caches prompt prefixes automatically; it reports the hits here"""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.record_prompt_tokens(usage.prompt_tokens, getattr(details, "cached_tokens", 0) if details else 0)
+            
     def is_available(self) -> bool:
-        return self.client is not None and self.config.api_key and self.config.api_key.startswith("sk-proj-")
+        return bool(self.config.api_key) and self.config.api_key.startswith("sk-proj-") and self.sdk_installed()
 
 class AnthropicProvider(LLMProvider):
     """Anthropic Claude provider"""
     
-    def __init__(self, config: ProviderConfig):
-        super().__init__(config)
-        try:
-            if config.api_key and config.api_key not in ["your_anthropic_api_key_here", ""]:
-                import anthropic
-                self.client = anthropic.Anthropic(api_key=config.api_key)
-            else:
-                self.client = None
-                logger.warning("Anthropic API key not configured properly")
-        except Exception as e:
-            logger.error(f"Failed to initialize Anthropic: {e}")
-            self.client = None
+    sdk_module = "anthropic"
+    
+    def _create_client(self):
+        import anthropic
+        return anthropic.AsyncAnthropic(
+            api_key=self.config.api_key,
+            http_client=get_http_client(),
+            timeout=LLM_TIMEOUT
+        )
             
-    async def generate_content(self, prompt: str) -> str:
+    async def generate_content(self, prompt: str, json_mode: bool = False) -> str:
         try:
-            if not self.client:
-                raise Exception("Anthropic client not initialized")
-                
-            response = self.client.messages.create(
+            response = await self.client.messages.create(
                 model="claude-3-haiku-20240307",
                 max_tokens=2000,
-                messages=[{"role": "user", "content": prompt}]
+                messages=self._messages(prompt, json_mode)
             )
+            self._record_usage(response.usage)
             
-            return response.content[0].text.strip()
+            text = response.content[0].text.strip()
+            return JSON_PREFILL + text if json_mode else text
             
         except Exception as e:
             logger.error(f"Anthropic error: {e}")
             raise
             
+    async def stream_content(self, prompt: str, json_mode: bool = False) -> AsyncIterator[str]:
+        try:
+            async with self.client.messages.stream(
+                model="claude-3-haiku-20240307",
+                max_tokens=2000,
+                messages=self._messages(prompt, json_mode)
+            ) as stream:
+                if json_mode:
+                    yield JSON_PREFILL
+                async for text in stream.text_stream:
+                    yield text
+                self._record_usage((await stream.get_final_message()).usage)
+                    
+        except Exception as e:
+            logger.error(f"Anthropic streaming error: {e}")
+            raise
+            
+    def _messages(self, prompt: str, json_mode: bool) -> List[Dict[str, Any]]:
+        """Anthropic has no JSON mode; prefilling the answer with "{" has the same effect"""
+        messages = [{"role": "user", "content": self._content(prompt)}]
+        if json_mode:
+            messages.append({"role": "assistant", "content": JSON_PREFILL})
+        return messages
+            
+    def _content(self, prompt: str):
+        """Mark the static prefix of a split prompt as cacheable once it is long enough"""
+        if not getattr(prompt, "cacheable", False):
+            return prompt
+        return [
+            {"type": "text", "text": prompt.prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": prompt.suffix}
+        ]
+            
+    def _record_usage(self, usage):
+        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        self.record_prompt_tokens(usage.input_tokens + cache_read + cache_write, cache_read)
+            
     def is_available(self) -> bool:
-        return self.client is not None and self.config.api_key and self.config.api_key not in ["your_anthropic_api_key_here", ""]
+        return bool(self.config.api_key) and self.config.api_key != "your_anthropic_api_key_here" and self.sdk_installed()
 
 class OpenRouterProvider(LLMProvider):
     """OpenRouter provider"""
     
-    def __init__(self, config: ProviderConfig):
-        super().__init__(config)
-        try:
-            if config.api_key and config.api_key.startswith("sk-or-"):
-                import openai
-                self.client = openai.OpenAI(
-                    base_url="https://openrouter.ai/api/v1",
-                    api_key=config.api_key
-                )
-            else:
-                self.client = None
-                logger.warning("OpenRouter API key not configured properly")
-        except Exception as e:
-            logger.error(f"Failed to initialize OpenRouter: {e}")
-            self.client = None
+    sdk_module = "openai"
+    
+    def _create_client(self):
+        import openai
+        return openai.AsyncOpenAI(
+            base_url="https://openrouter.ai/api/v1",
+            api_key=self.config.api_key,
+            http_client=get_http_client(),
+            timeout=LLM_TIMEOUT
+        )
             
-    async def generate_content(self, prompt: str) -> str:
+    async def generate_content(self, prompt: str, json_mode: bool = False) -> str:
         try:
-            if not self.client:
-                raise Exception("OpenRouter client not initialized")
-                
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="mistralai/mistral-7b-instruct:free",
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=2000,
@@ -244,31 +495,42 @@ class OpenRouterProvider(LLMProvider):
             logger.error(f"OpenRouter error: {e}")
             raise
             
+    async def stream_content(self, prompt: str, json_mode: bool = False) -> AsyncIterator[str]:
+        try:
+            stream = await self.client.chat.completions.create(
+                model="mistralai/mistral-7b-instruct:free",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=2000,
+                temperature=0.7,
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                    
+        except Exception as e:
+            logger.error(f"OpenRouter streaming error: {e}")
+            raise
+            
     def is_available(self) -> bool:
-        return self.client is not None and self.config.api_key and self.config.api_key.startswith("sk-or-")
+        return bool(self.config.api_key) and self.config.api_key.startswith("sk-or-") and self.sdk_installed()
 
 class CohereProvider(LLMProvider):
     """Cohere provider"""
     
-    def __init__(self, config: ProviderConfig):
-        super().__init__(config)
-        try:
-            if config.api_key and config.api_key not in ["your_cohere_api_key_here", ""]:
-                import cohere
-                self.client = cohere.Client(config.api_key)
-            else:
-                self.client = None
-                logger.warning("Cohere API key not configured properly")
-        except Exception as e:
-            logger.error(f"Failed to initialize Cohere: {e}")
-            self.client = None
+    sdk_module = "cohere"
+    
+    def _create_client(self):
+        import cohere
+        return cohere.AsyncClient(
+            api_key=self.config.api_key,
+            httpx_client=get_http_client(),
+            timeout=LLM_TIMEOUT
+        )
             
-    async def generate_content(self, prompt: str) -> str:
+    async def generate_content(self, prompt: str, json_mode: bool = False) -> str:
         try:
-            if not self.client:
-                raise Exception("Cohere client not initialized")
-                
-            response = self.client.generate(
+            response = await self.client.generate(
                 model="command-light",
                 prompt=prompt,
                 max_tokens=2000,
@@ -282,34 +544,29 @@ class CohereProvider(LLMProvider):
             raise
             
     def is_available(self) -> bool:
-        return self.client is not None and self.config.api_key and self.config.api_key not in ["your_cohere_api_key_here", ""]
+        return bool(self.config.api_key) and self.config.api_key != "your_cohere_api_key_here" and self.sdk_installed()
 
 class MistralProvider(LLMProvider):
     """Mistral provider"""
     
-    def __init__(self, config: ProviderConfig):
-        super().__init__(config)
-        try:
-            if config.api_key and config.api_key not in ["your_mistral_api_key_here", ""]:
-                import mistralai
-                self.client = mistralai.Mistral(api_key=config.api_key)
-            else:
-                self.client = None
-                logger.warning("Mistral API key not configured properly")
-        except Exception as e:
-            logger.error(f"Failed to initialize Mistral: {e}")
-            self.client = None
+    sdk_module = "mistralai"
+    
+    def _create_client(self):
+        import mistralai
+        return mistralai.Mistral(
+            api_key=self.config.api_key,
+            async_client=get_http_client(),
+            timeout_ms=int(LLM_TIMEOUT * 1000)
+        )
             
-    async def generate_content(self, prompt: str) -> str:
+    async def generate_content(self, prompt: str, json_mode: bool = False) -> str:
         try:
-            if not self.client:
-                raise Exception("Mistral client not initialized")
-                
-            response = self.client.chat.complete(
+            response = await self.client.chat.complete_async(
                 model="mistral-tiny",
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=2000,
-                temperature=0.7
+                temperature=0.7,
+                **({"response_format": JSON_RESPONSE_FORMAT} if json_mode else {})
             )
             
             return response.choices[0].message.content.strip()
@@ -318,8 +575,26 @@ class MistralProvider(LLMProvider):
             logger.error(f"Mistral error: {e}")
             raise
             
+    async def stream_content(self, prompt: str, json_mode: bool = False) -> AsyncIterator[str]:
+        try:
+            stream = await self.client.chat.stream_async(
+                model="mistral-tiny",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=2000,
+                temperature=0.7,
+                **({"response_format": JSON_RESPONSE_FORMAT} if json_mode else {})
+            )
+            async for event in stream:
+                delta = event.data.choices[0].delta.content if event.data.choices else None
+                if delta:
+                    yield delta
+                    
+        except Exception as e:
+            logger.error(f"Mistral streaming error: {e}")
+            raise
+            
     def is_available(self) -> bool:
-        return self.client is not None and self.config.api_key and self.config.api_key not in ["your_mistral_api_key_here", ""]
+        return bool(self.config.api_key) and self.config.api_key != "your_mistral_api_key_here" and self.sdk_installed()
 
 class HuggingFaceProvider(LLMProvider):
     """Hugging Face provider"""
@@ -333,14 +608,12 @@ class HuggingFaceProvider(LLMProvider):
             self.api_key = None
             logger.warning("Hugging Face API key not configured properly")
         
-    async def generate_content(self, prompt: str) -> str:
+    async def generate_content(self, prompt: str, json_mode: bool = False) -> str:
         try:
-            import requests
-            
             headers = {"Authorization": f"Bearer {self.api_key}"}
             data = {"inputs": prompt}
             
-            response = requests.post(self.base_url, headers=headers, json=data)
+            response = await get_http_client().post(self.base_url, headers=headers, json=data)
             
             if response.status_code != 200:
                 raise Exception(f"HuggingFace API error: {response.status_code}")
@@ -359,29 +632,57 @@ class HuggingFaceProvider(LLMProvider):
     def is_available(self) -> bool:
         return self.api_key is not None
 
+PROVIDER_NAMES = ("gemini", "openai", "anthropic", "openrouter", "cohere", "mistral", "huggingface")
+
 class MultiLLMManager:
     """Manages multiple LLM providers with automatic fallback"""
     
-    def __init__(self):
+    def __init__(self, api_keys: Optional[Dict[str, str]] = None, load: bool = True):
         self.providers: List[LLMProvider] = []
-        self.load_providers()
+        self.api_keys = api_keys
+        self.router = ProviderRouter()
+        self.quota_store = None
+        # Fingerprint of the keys the current providers were built from
+        self._loaded_keys: Optional[str] = None
+        if load:
+            self.load_providers()
+        
+    def _api_key(self, provider_name: str) -> str:
+        """API key for a provider: the explicit keys if given, else the environment"""
+        if self.api_keys is not None:
+            return self.api_keys.get(provider_name, "")
+        return os.getenv(f"{provider_name.upper()}_API_KEY", "")
         
     def load_providers(self):
-        """Load all available providers"""
+        """Load all available providers
+        
+        Idempotent: calling it again is a no-op unless the API keys changed,
+        in which case the provider list is rebuilt rather than appended to.
+        SDKs are not imported here but on each provider's first request.
+        """
+        keys = {name: self._api_key(name) for name in PROVIDER_NAMES}
+        fingerprint = key_fingerprint(keys)
+        if fingerprint == self._loaded_keys:
+            return
+            
+        providers: List[LLMProvider] = []
         try:
-            # Debug: Print environment variables
-            logger.info(f"OPENAI_API_KEY: {os.getenv('OPENAI_API_KEY', 'NOT_SET')[:20]}...")
-            logger.info(f"OPENROUTER_API_KEY: {os.getenv('OPENROUTER_API_KEY', 'NOT_SET')[:20]}...")
+            if self.api_keys is None:
+                # Debug: Print environment variables
+                logger.info(f"OPENAI_API_KEY: {os.getenv('OPENAI_API_KEY', 'NOT_SET')[:20]}...")
+                logger.info(f"OPENROUTER_API_KEY: {os.getenv('OPENROUTER_API_KEY', 'NOT_SET')[:20]}...")
             
             # Provider configurations
             provider_configs = {
                 "gemini": ProviderConfig(
                     name="gemini",
-                    api_key=os.getenv("GEMINI_API_KEY", ""),
+                    api_key=self._api_key("gemini"),
                     priority=1,
                     status=ProviderStatus.ACTIVE,
                     max_requests_per_minute=15,
                     max_requests_per_day=1000,
+                    max_concurrency=5,
+                    max_input_tokens=100_000,
                     current_requests_minute=0,
                     current_requests_day=0,
                     last_reset_minute=datetime.now(),
@@ -392,11 +693,13 @@ class MultiLLMManager:
                 ),
                 "openai": ProviderConfig(
                     name="openai",
-                    api_key=os.getenv("OPENAI_API_KEY", ""),
+                    api_key=self._api_key("openai"),
                     priority=2,
                     status=ProviderStatus.ACTIVE,
                     max_requests_per_minute=3,
                     max_requests_per_day=100,
+                    max_concurrency=2,
+                    max_input_tokens=12_000,
                     current_requests_minute=0,
                     current_requests_day=0,
                     last_reset_minute=datetime.now(),
@@ -407,11 +710,13 @@ class MultiLLMManager:
                 ),
                 "anthropic": ProviderConfig(
                     name="anthropic",
-                    api_key=os.getenv("ANTHROPIC_API_KEY", ""),
+                    api_key=self._api_key("anthropic"),
                     priority=3,
                     status=ProviderStatus.ACTIVE,
                     max_requests_per_minute=5,
                     max_requests_per_day=200,
+                    max_concurrency=3,
+                    max_input_tokens=100_000,
                     current_requests_minute=0,
                     current_requests_day=0,
                     last_reset_minute=datetime.now(),
@@ -422,11 +727,13 @@ class MultiLLMManager:
                 ),
                 "openrouter": ProviderConfig(
                     name="openrouter",
-                    api_key=os.getenv("OPENROUTER_API_KEY", ""),
+                    api_key=self._api_key("openrouter"),
                     priority=4,
                     status=ProviderStatus.ACTIVE,
                     max_requests_per_minute=10,
                     max_requests_per_day=500,
+                    max_concurrency=4,
+                    max_input_tokens=6_000,
                     current_requests_minute=0,
                     current_requests_day=0,
                     last_reset_minute=datetime.now(),
@@ -437,11 +744,13 @@ class MultiLLMManager:
                 ),
                 "cohere": ProviderConfig(
                     name="cohere",
-                    api_key=os.getenv("COHERE_API_KEY", ""),
+                    api_key=self._api_key("cohere"),
                     priority=5,
                     status=ProviderStatus.ACTIVE,
                     max_requests_per_minute=5,
                     max_requests_per_day=100,
+                    max_concurrency=2,
+                    max_input_tokens=3_000,
                     current_requests_minute=0,
                     current_requests_day=0,
                     last_reset_minute=datetime.now(),
@@ -452,11 +761,13 @@ class MultiLLMManager:
                 ),
                 "mistral": ProviderConfig(
                     name="mistral",
-                    api_key=os.getenv("MISTRAL_API_KEY", ""),
+                    api_key=self._api_key("mistral"),
                     priority=6,
                     status=ProviderStatus.ACTIVE,
                     max_requests_per_minute=5,
                     max_requests_per_day=100,
+                    max_concurrency=2,
+                    max_input_tokens=24_000,
                     current_requests_minute=0,
                     current_requests_day=0,
                     last_reset_minute=datetime.now(),
@@ -467,11 +778,13 @@ class MultiLLMManager:
                 ),
                 "huggingface": ProviderConfig(
                     name="huggingface",
-                    api_key=os.getenv("HUGGINGFACE_API_KEY", ""),
+                    api_key=self._api_key("huggingface"),
                     priority=7,
                     status=ProviderStatus.ACTIVE,
                     max_requests_per_minute=10,
                     max_requests_per_day=1000,
+                    max_concurrency=4,
+                    max_input_tokens=800,
                     current_requests_minute=0,
                     current_requests_day=0,
                     last_reset_minute=datetime.now(),
@@ -497,8 +810,10 @@ class MultiLLMManager:
                 try:
                     provider_class = provider_classes[name]
                     provider = provider_class(config)
+                    provider.breaker.pool = "shared" if self.api_keys is None else "user"
+                    provider.quota = self.quota_store
                     if provider.is_available():
-                        self.providers.append(provider)
+                        providers.append(provider)
                         logger.info(f"Successfully loaded provider: {name}")
                     else:
                         logger.warning(f"Provider {name} is not available (missing API key)")
@@ -506,50 +821,271 @@ class MultiLLMManager:
                     logger.error(f"Failed to load provider {name}: {e}")
                     
             # Sort providers by priority
-            self.providers.sort(key=lambda p: p.config.priority)
+            providers.sort(key=lambda p: p.config.priority)
+            self.providers = providers
+            self._loaded_keys = fingerprint
             
             logger.info(f"Loaded {len(self.providers)} LLM providers")
             
         except Exception as e:
             logger.error(f"Failed to load providers: {e}")
             
-    async def generate_content(self, prompt: str) -> Tuple[str, str]:
-        """Generate content using available providers with fallback"""
-        last_error = None
+    def _candidates(self, prefer: Optional[str] = None) -> List[LLMProvider]:
+        """Providers in routing order, with the preferred one moved to the front"""
+        ordered = self.router.order(self.providers)
+        if prefer is None:
+            return ordered
+        return sorted(ordered, key=lambda provider: provider.name != prefer)
         
+    def use_quota_store(self, quota_store):
+        """Count requests in a quota store shared with other worker processes"""
+        self.quota_store = quota_store
         for provider in self.providers:
-            try:
-                # Check if provider can make request
-                if not provider.can_make_request():
-                    logger.info(f"Provider {provider.name} has reached rate limit, skipping")
-                    continue
-                    
-                # Check if provider is available
-                if provider.config.status != ProviderStatus.ACTIVE:
-                    logger.info(f"Provider {provider.name} is not active, skipping")
+            provider.quota = quota_store
+            
+    def routing_order(self) -> List[str]:
+        """Names of the providers in the order the next request would try them"""
+        return [provider.name for provider in self._candidates()]
+        
+    def eligible_providers(self) -> List[LLMProvider]:
+        """Providers that could take a request right now"""
+        return [
+            provider for provider in self.providers
+            if provider.config.status == ProviderStatus.ACTIVE
+            and provider.breaker.state == CircuitState.CLOSED
+            and provider.can_make_request()
+        ]
+        
+    async def _acquire(self, provider: LLMProvider) -> bool:
+        """Take a slot on a provider, waiting briefly rather than falling back at once
+        
+        A provider whose next token or concurrency slot is more than
+        LLM_RATE_LIMIT_MAX_WAIT away is skipped in favour of the next one.
+        On success the request is already recorded against its quota.
+        """
+        # Check if provider is available
+        if provider.config.status not in (ProviderStatus.ACTIVE, ProviderStatus.ERROR):
+            logger.info(f"Provider {provider.name} is not active, skipping")
+            return False
+            
+        # An open circuit lets a single probe through once its pause is over
+        allowed = provider.breaker.allow_request()
+        provider._sync_status()
+        if not allowed:
+            logger.info(f"Circuit for provider {provider.name} is open, skipping")
+            return False
+            
+        # Check if provider can make request
+        if not await provider.acquire(LLM_RATE_LIMIT_MAX_WAIT):
+            provider.breaker.cancel_probe()
+            logger.info(f"Provider {provider.name} has reached rate limit, skipping")
+            return False
+            
+        provider.record_request()
+        return True
+        
+    def _start_call(self, provider: LLMProvider, prompt: str, json_mode: bool = False) -> asyncio.Task:
+        """Run _call_provider as a task that gives back the slot taken by _acquire
+        
+        The slot is released from a done callback rather than inside the
+        coroutine, because a task cancelled before its first step never runs
+        its body.
+        """
+        task = asyncio.create_task(self._call_provider(provider, prompt, json_mode))
+        
+        def finished(task: asyncio.Task):
+            provider.release()
+            if task.cancelled():
+                provider.breaker.cancel_probe()
+                
+        task.add_done_callback(finished)
+        return task
+        
+    async def _call_provider(self, provider: LLMProvider, prompt: str, json_mode: bool = False) -> str:
+        """Call one provider holding a slot from _acquire, recording latency and outcome"""
+        started = time.monotonic()
+        try:
+            content = await provider.generate_content(prompt, json_mode)
+        except asyncio.CancelledError:
+            # Lost a hedge race; the request still counts against quota but is not an error
+            LLM_REQUEST_SECONDS.observe(time.monotonic() - started, provider=provider.name, outcome="cancelled")
+            raise
+        except Exception as e:
+            elapsed = time.monotonic() - started
+            LLM_REQUEST_SECONDS.observe(elapsed, provider=provider.name, outcome="error")
+            self.router.record_call(provider.name, elapsed, success=False)
+            provider.record_error(str(e))
+            raise
+        elapsed = time.monotonic() - started
+        LLM_REQUEST_SECONDS.observe(elapsed, provider=provider.name, outcome="success")
+        self.router.record_call(provider.name, elapsed, success=True)
+        provider.record_latency(elapsed)
+        provider.record_success()
+        return content
+        
+    async def call_provider(self, provider: LLMProvider, prompt: str, json_mode: bool = False) -> Optional[str]:
+        """Call one given provider under its rate limit, concurrency cap and circuit breaker
+        
+        Returns None when the provider can't take a request now.
+        """
+        if not await self._acquire(provider):
+            return None
+        return await self._start_call(provider, prompt, json_mode)
+        
+    def _hedge_delay(self, provider: LLMProvider) -> float:
+        """How long to wait for a provider before starting a hedge request"""
+        delay = provider.latency_percentile(LLM_HEDGE_PERCENTILE)
+        if delay is None:
+            delay = LLM_HEDGE_DEFAULT_DELAY
+        return max(delay, LLM_HEDGE_MIN_DELAY)
+        
+    async def generate_content(
+        self,
+        prompt: str,
+        validator: Optional[Callable[[str], bool]] = None,
+        fit_prompt: Optional[Callable[[int], str]] = None,
+        json_mode: bool = False,
+        prefer: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """Generate content using available providers with fallback
+        
+        fit_prompt, if given, builds the prompt for a provider's
+        max_input_tokens budget and is used instead of prompt. json_mode
+        asks providers that support it for a JSON object. prefer names a
+        provider to try first; the others remain as fallbacks.
+        
+        With hedging enabled, a second provider is started when the current one
+        is slower than its usual latency percentile, and the first response that
+        passes validator wins. A response that fails validator falls through to
+        the next provider; it is only returned if no provider does better.
+        """
+        last_error = None
+        invalid_result = None
+        candidates = iter(self._candidates(prefer))
+        pending: Dict[asyncio.Task, Tuple[LLMProvider, float]] = {}
+        attempts = 0
+        
+        async def start_next() -> bool:
+            nonlocal attempts
+            for provider in candidates:
+                if not await self._acquire(provider):
                     continue
-                    
                 logger.info(f"Attempting to use provider: {provider.name}")
+                provider_prompt = fit_prompt(provider.config.max_input_tokens) if fit_prompt else prompt
+                task = self._start_call(provider, provider_prompt, json_mode)
+                pending[task] = (provider, time.monotonic())
+                attempts += 1
+                return True
+            return False
+            
+        try:
+            await start_next()
+            while pending:
+                timeout = None
+                if LLM_HEDGING_ENABLED and len(pending) < LLM_HEDGE_MAX_PARALLEL:
+                    newest, started = max(pending.values(), key=lambda entry: entry[1])
+                    timeout = max(0.0, started + self._hedge_delay(newest) - time.monotonic())
+                    
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
                 
-                # Record request
-                provider.record_request()
-                
-                # Generate content
-                content = await provider.generate_content(prompt)
-                
-                # Record success
-                provider.record_success()
+                if not done:
+                    if await start_next():
+                        logger.info(f"Provider {newest.name} is slow, started hedge request")
+                    else:
+                        # Nothing left to hedge with; just wait for what is in flight
+                        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        
+                for task in done:
+                    provider, _ = pending.pop(task)
+                    try:
+                        content = task.result()
+                    except Exception as e:
+                        last_error = str(e)
+                        logger.error(f"Provider {provider.name} failed: {e}")
+                        continue
+                        
+                    valid = validator is None or validator(content)
+                    if validator is not None:
+                        self.router.record_validity(provider.name, valid)
+                    if valid:
+                        logger.info(f"Successfully generated content using {provider.name}")
+                        LLM_FALLBACK_DEPTH.inc(depth=str(attempts - 1))
+                        return content, provider.name
+                        
+                    logger.warning(f"Provider {provider.name} returned an invalid response")
+                    if invalid_result is None:
+                        invalid_result = (content, provider.name)
+                        
+                if not pending:
+                    await start_next()
+        finally:
+            for task in pending:
+                task.cancel()
                 
-                logger.info(f"Successfully generated content using {provider.name}")
-                return content, provider.name
+        if invalid_result is not None:
+            LLM_FALLBACK_DEPTH.inc(depth=str(attempts - 1))
+            return invalid_result
+            
+        # If all providers failed
+        LLM_FALLBACK_DEPTH.inc(depth="failed")
+        error_msg = f"All LLM providers failed. Last error: {last_error}"
+        logger.error(error_msg)
+        raise Exception(error_msg)
+        
+    async def stream_content(
+        self,
+        prompt: str,
+        fit_prompt: Optional[Callable[[int], str]] = None,
+        json_mode: bool = False
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """Stream content from the first provider that answers
+        
+        Yields ("provider", name) when a provider is chosen and then
+        ("token", text) chunks. Falls back to the next provider only while
+        nothing has been streamed yet. fit_prompt and json_mode work as in
+        generate_content.
+        """
+        last_error = None
+        attempts = 0
+        
+        for provider in self._candidates():
+            if not await self._acquire(provider):
+                continue
                 
+            logger.info(f"Attempting to stream from provider: {provider.name}")
+            attempts += 1
+            started = time.monotonic()
+            streamed = False
+            try:
+                yield "provider", provider.name
+                provider_prompt = fit_prompt(provider.config.max_input_tokens) if fit_prompt else prompt
+                async for chunk in provider.stream_content(provider_prompt, json_mode):
+                    streamed = True
+                    yield "token", chunk
             except Exception as e:
+                elapsed = time.monotonic() - started
+                LLM_REQUEST_SECONDS.observe(elapsed, provider=provider.name, outcome="error")
+                self.router.record_call(provider.name, elapsed, success=False)
                 last_error = str(e)
                 provider.record_error(last_error)
-                logger.error(f"Provider {provider.name} failed: {e}")
+                logger.error(f"Provider {provider.name} failed while streaming: {e}")
+                if streamed:
+                    raise
                 continue
+            finally:
+                provider.release()
                 
+            elapsed = time.monotonic() - started
+            LLM_REQUEST_SECONDS.observe(elapsed, provider=provider.name, outcome="success")
+            self.router.record_call(provider.name, elapsed, success=True)
+            LLM_FALLBACK_DEPTH.inc(depth=str(attempts - 1))
+            provider.record_latency(elapsed)
+            provider.record_success()
+            logger.info(f"Successfully streamed content using {provider.name}")
+            return
+            
         # If all providers failed
+        LLM_FALLBACK_DEPTH.inc(depth="failed")
         error_msg = f"All LLM providers failed. Last error: {last_error}"
         logger.error(error_msg)
         raise Exception(error_msg)
@@ -558,6 +1094,7 @@ class MultiLLMManager:
         """Get status of all providers"""
         status = {}
         for provider in self.providers:
+            provider._sync_usage()
             status[provider.name] = {
                 "status": provider.config.status.value,
                 "priority": provider.config.priority,
@@ -565,12 +1102,73 @@ class MultiLLMManager:
                 "max_requests_day": provider.config.max_requests_per_day,
                 "requests_this_minute": provider.config.current_requests_minute,
                 "max_requests_minute": provider.config.max_requests_per_minute,
+                "in_flight": provider.in_flight,
+                "max_concurrency": provider.config.max_concurrency,
+                "rate_limit_wait_seconds": round(provider.rate_limiter.wait_time(), 3),
                 "error_count": provider.config.error_count,
                 "last_error": provider.config.last_error,
                 "last_success": provider.config.last_success.isoformat() if provider.config.last_success else None,
-                "can_make_request": provider.can_make_request()
+                "can_make_request": provider.can_make_request(),
+                "routing": self.router.snapshot(provider.name),
+                "circuit": provider.breaker.snapshot()
             }
         return status
 
-# Global instance
-llm_manager = MultiLLMManager()
\ No newline at end of file
+def key_fingerprint(api_keys: Dict[str, str]) -> str:
+    """Stable hash of a set of API keys, so key changes get a fresh manager"""
+    payload = json.dumps(sorted(api_keys.items()))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class UserManagerPool:
+    """LRU pool of per-user managers so SDK clients are reused across requests"""
+    
+    def __init__(self, max_size: int, idle_seconds: int):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self._managers: "OrderedDict[Tuple[str, str], Tuple[float, MultiLLMManager]]" = OrderedDict()
+        
+    @property
+    def size(self) -> int:
+        return len(self._managers)
+        
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._managers:
+            key, (last_used, _) = next(iter(self._managers.items()))
+            if last_used >= cutoff:
+                break
+            del self._managers[key]
+            USER_MANAGER_EVICTIONS.inc()
+            
+    def get(self, user_id: str, user_api_keys: Dict[str, str]) -> MultiLLMManager:
+        """Get the manager for a user's keys, building it on first use
+        
+        user_api_keys uses the stored field names, e.g. "gemini_api_key".
+        """
+        api_keys = {
+            name[:-len("_api_key")] if name.endswith("_api_key") else name: key
+            for name, key in user_api_keys.items()
+        }
+        key = (user_id, key_fingerprint(api_keys))
+        
+        self._evict_idle()
+        entry = self._managers.pop(key, None)
+        if entry is not None:
+            USER_MANAGER_LOOKUPS.inc(result="hit")
+            manager = entry[1]
+        else:
+            USER_MANAGER_LOOKUPS.inc(result="miss")
+            # Drop managers built from keys the user has since replaced
+            for stale_key in [k for k in self._managers if k[0] == user_id]:
+                del self._managers[stale_key]
+            manager = MultiLLMManager(api_keys=api_keys)
+            
+        self._managers[key] = (time.monotonic(), manager)
+        while len(self._managers) > self.max_size:
+            self._managers.popitem(last=False)
+            USER_MANAGER_EVICTIONS.inc()
+        return manager
+
+# Global instance; the server loads its providers at startup, once .env has been read
+llm_manager = MultiLLMManager(load=False)
+user_llm_pool = UserManagerPool(max_size=LLM_USER_POOL_SIZE, idle_seconds=LLM_USER_POOL_IDLE_SECONDS)
\ No newline at end of file
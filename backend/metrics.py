@@ -0,0 +1,203 @@
+"""
+Metrics registry
+In-process counters, gauges and histograms exposed in Prometheus text format
+
+Metrics are updated from the event loop thread only, so recording is a
+dict lookup and an addition with no locking.
+"""
+
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (10_000, 100_000, 500_000, 1_000_000, 2_000_000, 5_000_000, 10_000_000, 20_000_000)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+class Gauge(_Metric):
+    """Current value, either set directly or read from a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        if self.callback is not None:
+            return [f"{self.name} {_format_value(self.callback())}"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+class Histogram(_Metric):
+    """Observations counted into fixed buckets per label set"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last)], sum, count
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Holds all metrics and renders them for scraping"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Global registry
+registry = MetricsRegistry()
+
+# LLM providers
+LLM_REQUEST_SECONDS = registry.histogram(
+    "llm_request_duration_seconds", "LLM provider call latency", ["provider", "outcome"]
+)
+LLM_FALLBACK_DEPTH = registry.counter(
+    "llm_fallback_depth_total", "Answered LLM requests by number of extra providers started", ["depth"]
+)
+LLM_PROMPT_TOKENS = registry.counter(
+    "llm_prompt_tokens_total", "Prompt tokens billed by providers that report usage", ["provider"]
+)
+LLM_CACHED_PROMPT_TOKENS = registry.counter(
+    "llm_cached_prompt_tokens_total", "Prompt tokens served from the provider's prefix cache", ["provider"]
+)
+USER_MANAGER_LOOKUPS = registry.counter(
+    "llm_user_manager_lookups_total", "Per-user LLM manager pool lookups by result (hit, miss)", ["result"]
+)
+USER_MANAGER_EVICTIONS = registry.counter(
+    "llm_user_manager_evictions_total", "Per-user LLM managers dropped for being idle or over the pool size"
+)
+CIRCUIT_TRANSITIONS = registry.counter(
+    "llm_circuit_transitions_total", "Circuit breaker state changes", ["provider", "pool", "from_state", "to_state"]
+)
+CIRCUIT_STATE = registry.gauge(
+    "llm_circuit_state", "Circuit breaker state of the shared providers (0 closed, 1 half-open, 2 open)", ["provider"]
+)
+
+# Text extraction
+OCR_SECONDS = registry.histogram("ocr_duration_seconds", "Image OCR time including queueing")
+PDF_EXTRACTION_SECONDS = registry.histogram("pdf_extraction_duration_seconds", "PDF text extraction time including queueing")
+UPLOAD_BYTES = registry.histogram("upload_size_bytes", "Size of uploaded files", ["kind"], buckets=SIZE_BUCKETS)
+EXTRACTION_REJECTED = registry.counter(
+    "extraction_rejected_total", "Extraction jobs turned away because the queue was full"
+)
+
+# Prompt construction
+PROMPT_TOKENS_SAVED = registry.counter(
+    "prompt_tokens_saved_total", "Estimated prompt tokens removed before sending", ["stage"]
+)
+
+# Analysis handlers
+JSON_PARSE_RESULTS = registry.counter(
+    "llm_json_parse_total", "Parsed LLM answers by outcome (clean, repaired, failed)", ["outcome"]
+)
+SINGLE_FLIGHT_CALLS = registry.counter(
+    "single_flight_calls_total",
+    "Calls that started a single-flight call (leader) or joined one already in flight (coalesced)",
+    ["group", "role"]
+)
+ANALYSIS_RESULTS = registry.counter(
+    "analysis_results_total",
+    "Analysis responses by endpoint and outcome (success, repaired, truncated, cache_hit, parse_fallback, empty_response, llm_unavailable)",
+    ["endpoint", "outcome"]
+)
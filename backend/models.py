@@ -15,6 +15,19 @@ database: AsyncIOMotorDatabase = client.german_letters_db
 
 # Collections
 users_collection = database.users
+analysis_cache_collection = database.analysis_cache
+jobs_collection = database.jobs
+provider_quota_collection = database.provider_quota
+
+# Projections for user lookups, so each endpoint only fetches the fields it uses
+LOGIN_PROJECTION = {"_id": 0, "id": 1, "email": 1, "name": 1, "password_hash": 1, "is_active": 1}
+PROFILE_PROJECTION = {"_id": 0, "id": 1, "email": 1, "name": 1, "created_at": 1, "last_login": 1, "is_active": 1, "api_keys": 1}
+API_KEYS_PROJECTION = {"_id": 0, "id": 1, "api_keys": 1}
+
+async def ensure_user_indexes(collection=users_collection):
+    """Create the unique indexes that user lookups and registration rely on"""
+    await collection.create_index("email", unique=True)
+    await collection.create_index("id", unique=True)
 
 class UserApiKeys(BaseModel):
     """API keys for different LLM providers"""
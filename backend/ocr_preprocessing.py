@@ -0,0 +1,170 @@
+"""
+OCR image preprocessing
+Turns phone photos of letters into clean page images before Tesseract:
+grayscale, crop to the page, downscale to the target text DPI, deskew
+and binarize. Each step can be switched off.
+"""
+
+import os
+from dataclasses import dataclass, replace
+from typing import List, Optional
+
+def _env_flag(name: str, default: str = "true") -> bool:
+    return os.getenv(name, default).lower() == "true"
+
+# Assumed physical page width when estimating the DPI of a photo (A4)
+PAGE_WIDTH_INCHES = 8.27
+
+@dataclass
+class PreprocessOptions:
+    grayscale: bool = True
+    crop: bool = True
+    downscale: bool = True
+    deskew: bool = True
+    binarize: bool = True
+    target_dpi: int = 300
+    max_skew_degrees: float = 5.0
+    skew_step_degrees: float = 0.5
+
+    @classmethod
+    def from_env(cls) -> "PreprocessOptions":
+        """Read the step switches from the environment"""
+        enabled = _env_flag("OCR_PREPROCESS")
+        return cls(
+            grayscale=enabled and _env_flag("OCR_GRAYSCALE"),
+            crop=enabled and _env_flag("OCR_CROP"),
+            downscale=enabled and _env_flag("OCR_DOWNSCALE"),
+            deskew=enabled and _env_flag("OCR_DESKEW"),
+            binarize=enabled and _env_flag("OCR_BINARIZE"),
+            target_dpi=int(os.getenv("OCR_TARGET_DPI", "300")),
+            max_skew_degrees=float(os.getenv("OCR_MAX_SKEW_DEGREES", "5"))
+        )
+
+    @classmethod
+    def disabled(cls) -> "PreprocessOptions":
+        return cls(grayscale=False, crop=False, downscale=False, deskew=False, binarize=False)
+
+    def only(self, *steps: str) -> "PreprocessOptions":
+        """Copy with just the named steps enabled"""
+        return replace(self.disabled(), target_dpi=self.target_dpi, max_skew_degrees=self.max_skew_degrees,
+                       skew_step_degrees=self.skew_step_degrees, **{step: True for step in steps})
+
+def otsu_threshold(histogram: List[int]) -> int:
+    """Threshold that best separates a 256-bin grayscale histogram into two classes"""
+    total = sum(histogram)
+    if total == 0:
+        return 127
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+
+    best_threshold, best_variance = 127, -1.0
+    background, background_sum = 0, 0
+    for level, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        background_sum += level * count
+        mean_background = background_sum / background
+        mean_foreground = (weighted_total - background_sum) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = level, variance
+    return best_threshold
+
+def _binary(image, threshold: int):
+    return image.point(lambda p: 255 if p > threshold else 0)
+
+def crop_to_page(image, margin: float = 0.01):
+    """Crop a grayscale photo to the bright page region, if one stands out"""
+    thumbnail = image.copy()
+    thumbnail.thumbnail((256, 256))
+    bbox = _binary(thumbnail, otsu_threshold(thumbnail.histogram())).getbbox()
+    if bbox is None:
+        return image
+
+    left, top, right, bottom = bbox
+    # A tiny region is noise, a full-frame one means there is no background to remove
+    area = (right - left) * (bottom - top) / (thumbnail.width * thumbnail.height)
+    if area < 0.2 or area > 0.95:
+        return image
+
+    scale_x = image.width / thumbnail.width
+    scale_y = image.height / thumbnail.height
+    pad_x, pad_y = int(image.width * margin), int(image.height * margin)
+    return image.crop((
+        max(0, int(left * scale_x) - pad_x),
+        max(0, int(top * scale_y) - pad_y),
+        min(image.width, int(right * scale_x) + pad_x),
+        min(image.height, int(bottom * scale_y) + pad_y)
+    ))
+
+def downscale_to_dpi(image, target_dpi: int):
+    """Shrink the page so its width matches target_dpi on A4 paper; never upscale"""
+    from PIL import Image
+
+    target_width = int(PAGE_WIDTH_INCHES * target_dpi)
+    if image.width <= target_width:
+        return image
+    target_height = round(image.height * target_width / image.width)
+    return image.resize((target_width, target_height), Image.LANCZOS, reducing_gap=2.0)
+
+def _projection_score(image, angle: float) -> float:
+    """Sharpness of the row profile after rotating by angle; text lines make it spiky"""
+    from PIL import Image
+
+    rotated = image.rotate(angle, resample=Image.NEAREST, fillcolor=255)
+    rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+    return sum((rows[i + 1] - rows[i]) ** 2 for i in range(len(rows) - 1))
+
+def detect_skew(image, max_degrees: float, step: float) -> float:
+    """Find the rotation that best aligns the text lines, by projection profile"""
+    sample = image.copy()
+    sample.thumbnail((800, 800))
+    sample = _binary(sample, otsu_threshold(sample.histogram()))
+
+    steps = int(max_degrees / step)
+    best_angle, best_score = 0.0, _projection_score(sample, 0.0)
+    for i in range(-steps, steps + 1):
+        angle = i * step
+        if angle == 0:
+            continue
+        score = _projection_score(sample, angle)
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+def deskew(image, max_degrees: float, step: float):
+    """Rotate the page so the text lines are horizontal"""
+    from PIL import Image
+
+    angle = detect_skew(image, max_degrees, step)
+    if abs(angle) < step / 2:
+        return image
+    return image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+def binarize(image):
+    """Black text on white using a global Otsu threshold"""
+    return _binary(image, otsu_threshold(image.histogram()))
+
+def preprocess_image(image, options: Optional[PreprocessOptions] = None):
+    """Run the enabled preprocessing steps on a PIL image"""
+    from PIL import ImageOps
+
+    options = options or PreprocessOptions.from_env()
+    # Phone photos often store their orientation in EXIF only
+    image = ImageOps.exif_transpose(image)
+
+    # Crop, deskew and binarize work on luminance, so they imply grayscale
+    if options.grayscale or options.crop or options.deskew or options.binarize:
+        image = image.convert("L")
+    if options.crop:
+        image = crop_to_page(image)
+    if options.downscale:
+        image = downscale_to_dpi(image, options.target_dpi)
+    if options.deskew:
+        image = deskew(image, options.max_skew_degrees, options.skew_step_degrees)
+    if options.binarize:
+        image = binarize(image)
+    return image
@@ -0,0 +1,134 @@
+"""
+Analysis pipeline
+Runs a letter analysis as a list of named, replaceable stages that share
+one context, timing each stage for metrics and the Server-Timing header
+"""
+
+import os
+import time
+import logging
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import registry, ANALYSIS_RESULTS
+
+logger = logging.getLogger(__name__)
+
+# Allocation tracing is for profiling only: tracemalloc slows every allocation down
+PIPELINE_TRACE_ALLOCATIONS = os.getenv("PIPELINE_TRACE_ALLOCATIONS", "false").lower() == "true"
+
+STAGE_SECONDS = registry.histogram(
+    "analysis_stage_duration_seconds", "Time spent in each analysis pipeline stage", ["stage"]
+)
+# Only recorded with PIPELINE_TRACE_ALLOCATIONS; stages that free more than they allocate count as 0
+STAGE_ALLOCATED_BYTES = registry.histogram(
+    "analysis_stage_allocated_bytes",
+    "Net memory allocated by each analysis pipeline stage (PIPELINE_TRACE_ALLOCATIONS only)",
+    ["stage"],
+    buckets=(1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+)
+
+@dataclass
+class AnalysisContext:
+    """Input, intermediate results and output of one analysis"""
+    language: str
+    endpoint: str
+    bypass_cache: bool = False
+    text: Optional[str] = None
+    file_bytes: Optional[bytes] = None
+    content_type: Optional[str] = None
+    # Queue for an extraction worker instead of failing with 503 when the pool is busy
+    wait_for_extraction: bool = False
+    # Endpoint-specific pieces: which manager to call and how to word fallbacks
+    manager: Any = None
+    messages: Any = None
+    provider_label: str = "{provider}"
+    # Separate analysis cache for answers that must not be shared, e.g. "user:<id>"
+    cache_scope: str = ""
+    preferred_provider: Optional[str] = None
+
+    cache_key: Optional[str] = None
+    response_text: Optional[str] = None
+    used_provider: Optional[str] = None
+    analysis_data: Optional[Dict[str, Any]] = None
+    repaired: bool = False
+    # The letter was shortened to fit a provider's input budget
+    truncated: bool = False
+    response: Any = None
+    outcome: Optional[str] = None
+
+    timings: Dict[str, float] = field(default_factory=dict)
+    allocations: Dict[str, int] = field(default_factory=dict)
+
+    def finish(self, outcome: str, response: Any):
+        """Set the final response; later stages are skipped"""
+        self.outcome = outcome
+        self.response = response
+        ANALYSIS_RESULTS.inc(endpoint=self.endpoint, outcome=outcome)
+
+    @contextmanager
+    def timed(self, stage: str):
+        """Record the duration (and, when tracing, net allocations) of a stage"""
+        allocated = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+            STAGE_SECONDS.observe(elapsed, stage=stage)
+            if allocated is not None:
+                # Process-wide, so concurrent requests blur it; compare runs under the same load
+                delta = tracemalloc.get_traced_memory()[0] - allocated
+                self.allocations[stage] = self.allocations.get(stage, 0) + delta
+                STAGE_ALLOCATED_BYTES.observe(max(delta, 0), stage=stage)
+
+    def server_timing(self) -> str:
+        """Stage timings (and traced allocations) formatted for the Server-Timing response header"""
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.timings.items()]
+        entries += [f'{stage}-alloc;desc="{size} B"' for stage, size in self.allocations.items()]
+        return ", ".join(entries)
+
+Stage = Callable[[AnalysisContext], Awaitable[None]]
+
+class AnalysisPipeline:
+    """Ordered stages; a stage ends the run early by calling context.finish"""
+
+    def __init__(self, stages: List[Tuple[str, Stage]]):
+        self.stages = list(stages)
+        if PIPELINE_TRACE_ALLOCATIONS and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @property
+    def stage_names(self) -> List[str]:
+        return [name for name, _ in self.stages]
+
+    def replace(self, name: str, stage: Stage) -> "AnalysisPipeline":
+        """Copy of the pipeline with one stage swapped out"""
+        if name not in self.stage_names:
+            raise KeyError(f"Unknown pipeline stage: {name}")
+        return AnalysisPipeline([(n, stage if n == name else s) for n, s in self.stages])
+
+    def insert_before(self, name: str, new_name: str, stage: Stage) -> "AnalysisPipeline":
+        """Copy of the pipeline with an extra stage ahead of an existing one"""
+        index = self.stage_names.index(name)
+        return AnalysisPipeline(self.stages[:index] + [(new_name, stage)] + self.stages[index:])
+
+    async def run(
+        self,
+        context: AnalysisContext,
+        start: Optional[str] = None,
+        stop: Optional[str] = None
+    ) -> AnalysisContext:
+        """Run the stages from start up to, but not including, stop"""
+        names = self.stage_names
+        first = names.index(start) if start else 0
+        last = names.index(stop) if stop else len(names)
+        for name, stage in self.stages[first:last]:
+            if context.response is not None:
+                break
+            with context.timed(name):
+                await stage(context)
+        return context
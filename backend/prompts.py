@@ -0,0 +1,74 @@
+"""
+Prompt templates
+Analysis prompts loaded lazily from prompt_templates/<language>.txt. The
+static instructions always come first and the letter text last, so
+providers can cache the shared prefix once it is long enough.
+"""
+
+import os
+import logging
+from typing import Dict, List
+
+from text_normalizer import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TEMPLATES_DIR = os.getenv(
+    "PROMPT_TEMPLATES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_templates")
+)
+DEFAULT_LANGUAGE = "en"
+# Providers ignore cache hints on shorter prefixes (Anthropic Haiku: 2048
+# tokens, OpenAI: 1024); the current templates are well below this
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "2048"))
+
+class SplitPrompt(str):
+    """A prompt string that remembers where its static prefix ends
+
+    Behaves like the full prompt everywhere; providers that support
+    prompt caching can send prefix and suffix as separate blocks.
+    """
+
+    def __new__(cls, prefix: str, suffix: str):
+        prompt = super().__new__(cls, prefix + suffix)
+        prompt.prefix = prefix
+        prompt.suffix = suffix
+        return prompt
+
+    @property
+    def cacheable(self) -> bool:
+        """Whether the prefix is long enough for providers to cache it"""
+        return bool(self.suffix) and estimate_tokens(self.prefix) >= PROMPT_CACHE_MIN_TOKENS
+
+class PromptRegistry:
+    """Per-language analysis templates, read from disk on first use"""
+
+    def __init__(self, directory: str = PROMPT_TEMPLATES_DIR):
+        self.directory = directory
+        self._templates: Dict[str, str] = {}
+
+    def languages(self) -> List[str]:
+        """Languages with a template file"""
+        return sorted(
+            os.path.splitext(name)[0] for name in os.listdir(self.directory) if name.endswith(".txt")
+        )
+
+    def template(self, language: str) -> str:
+        """Static instructions for a language, falling back to English"""
+        template = self._templates.get(language)
+        if template is None:
+            path = os.path.join(self.directory, f"{os.path.basename(language)}.txt")
+            if not os.path.exists(path) and language != DEFAULT_LANGUAGE:
+                # Not cached: the language comes from the request
+                logger.debug(f"No prompt template for language '{language}', using {DEFAULT_LANGUAGE}")
+                return self.template(DEFAULT_LANGUAGE)
+            with open(path, encoding="utf-8") as f:
+                template = f.read()
+            self._templates[language] = template
+        return template
+
+    def build(self, text: str, language: str) -> SplitPrompt:
+        """Analysis prompt: the cacheable instructions followed by the letter"""
+        return SplitPrompt(self.template(language), text)
+
+# Global instance
+prompt_registry = PromptRegistry()
@@ -0,0 +1,150 @@
+"""
+Shared provider quota
+Request counts per provider in time-bucketed MongoDB documents, so every
+worker process enforces the same quota and usage survives restarts.
+Increments are batched locally and flushed with $inc every
+QUOTA_FLUSH_INTERVAL seconds instead of costing a round-trip per call.
+"""
+
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from models import provider_quota_collection
+
+logger = logging.getLogger(__name__)
+
+QUOTA_FLUSH_INTERVAL = float(os.getenv("QUOTA_FLUSH_INTERVAL", "1"))
+
+# Bucket id format (UTC) and how long a bucket document is kept
+PERIODS = {
+    "minute": ("%Y%m%d%H%M", timedelta(minutes=5)),
+    "day": ("%Y%m%d", timedelta(days=2))
+}
+
+BucketKey = Tuple[str, str, str]  # provider, period, bucket
+
+def bucket_id(period: str, now: Optional[datetime] = None) -> str:
+    """Id of the current time bucket for a period"""
+    return (now or datetime.utcnow()).strftime(PERIODS[period][0])
+
+class QuotaStore:
+    """Provider request counts shared through MongoDB
+
+    Between flushes other processes' requests are not visible, so the
+    shared quota can be overshot by at most what all workers send in one
+    flush interval.
+    """
+
+    def __init__(self, collection, flush_interval: float = QUOTA_FLUSH_INTERVAL):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self._shared: Dict[BucketKey, int] = {}     # counts last read from MongoDB
+        self._pending: Dict[BucketKey, int] = {}    # local increments not yet flushed
+        self._flushing: Dict[BucketKey, int] = {}   # increments written but not yet read back
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self):
+        """Create the indexes used to read current buckets and expire old ones"""
+        try:
+            await self.collection.create_index([("period", 1), ("bucket", 1)])
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.error(f"Failed to create quota indexes: {e}")
+
+    async def start(self):
+        """Load current usage and start flushing in the background"""
+        await self.refresh()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the background flush and write what is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def record(self, provider: str, count: int = 1):
+        """Count requests against the current minute and day"""
+        now = datetime.utcnow()
+        for period in PERIODS:
+            key = (provider, period, bucket_id(period, now))
+            self._pending[key] = self._pending.get(key, 0) + count
+
+    def used(self, provider: str, period: str) -> int:
+        """Requests in the current bucket across all processes, as far as known"""
+        key = (provider, period, bucket_id(period))
+        return self._shared.get(key, 0) + self._flushing.get(key, 0) + self._pending.get(key, 0)
+
+    def exhausted(self, provider: str, max_per_minute: int, max_per_day: int) -> bool:
+        """Whether the shared minute or day quota is used up"""
+        return self.used(provider, "minute") >= max_per_minute or self.used(provider, "day") >= max_per_day
+
+    async def flush(self):
+        """Write pending increments with one bulk $inc, then read the totals back"""
+        if self._pending:
+            pending, self._pending = self._pending, {}
+            for key, count in pending.items():
+                self._flushing[key] = self._flushing.get(key, 0) + count
+            now = datetime.utcnow()
+            operations = [
+                UpdateOne(
+                    {"_id": ":".join(key)},
+                    {
+                        "$inc": {"count": count},
+                        "$setOnInsert": {
+                            "provider": key[0],
+                            "period": key[1],
+                            "bucket": key[2],
+                            "expires_at": now + PERIODS[key[1]][1]
+                        }
+                    },
+                    upsert=True
+                )
+                for key, count in pending.items()
+            ]
+            try:
+                await self.collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                logger.error(f"Failed to flush provider quota: {e}")
+                # Retry with the next flush; until then they still count locally
+                for key, count in pending.items():
+                    self._flushing[key] -= count
+                    self._pending[key] = self._pending.get(key, 0) + count
+                return
+        await self.refresh()
+
+    async def refresh(self):
+        """Read the current buckets of all providers"""
+        flushed = self._flushing
+        self._flushing = {}
+        try:
+            shared = {}
+            query = {"$or": [{"period": period, "bucket": bucket_id(period)} for period in PERIODS]}
+            async for document in self.collection.find(query, {"provider": 1, "period": 1, "bucket": 1, "count": 1}):
+                shared[(document["provider"], document["period"], document["bucket"])] = document["count"]
+        except Exception as e:
+            logger.error(f"Failed to read provider quota: {e}")
+            # Keep the flushed increments visible until a read succeeds
+            for key, count in flushed.items():
+                self._shared[key] = self._shared.get(key, 0) + count
+            return
+        self._shared = shared
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Provider quota flush failed: {e}")
+
+# Global instance
+quota_store = QuotaStore(provider_quota_collection)
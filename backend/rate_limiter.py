@@ -0,0 +1,79 @@
+"""
+Rate limiting
+Sliding-window limits driven by a monotonic clock that callers can wait on
+"""
+
+import time
+import asyncio
+from collections import deque
+from typing import Callable, List
+
+class SlidingWindowLimit:
+    """At most `limit` requests in any `window` seconds
+
+    Unlike a token bucket starting full, this never lets a burst at the
+    edge of one window add to a full quota in the next.
+    """
+
+    def __init__(self, limit: int, window: float, clock: Callable[[], float] = time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self._times = deque()
+
+    def _expire(self, now: float):
+        while self._times and self._times[0] <= now - self.window:
+            self._times.popleft()
+
+    def available(self) -> int:
+        """Requests that may start right now"""
+        self._expire(self.clock())
+        return max(0, self.limit - len(self._times))
+
+    def wait_time(self) -> float:
+        """Seconds until one more request fits into the window"""
+        if self.limit <= 0:
+            return float("inf")
+        now = self.clock()
+        self._expire(now)
+        if len(self._times) < self.limit:
+            return 0.0
+        # The request that has to leave the window before there is room again
+        return self._times[len(self._times) - self.limit] + self.window - now
+
+    def consume(self):
+        """Count a request now; over-use delays later callers"""
+        self._times.append(self.clock())
+
+class RateLimiter:
+    """Combines several limits (e.g. per minute and per day)"""
+
+    def __init__(self, limits: List[SlidingWindowLimit]):
+        self.limits = limits
+
+    def wait_time(self) -> float:
+        """Seconds until every limit has room"""
+        return max((limit.wait_time() for limit in self.limits), default=0.0)
+
+    def consume(self):
+        """Count one request against every limit"""
+        for limit in self.limits:
+            limit.consume()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait until a request may start without counting it; False if that takes longer than timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            delay = self.wait_time()
+            if delay == 0:
+                return True
+            if time.monotonic() + delay > deadline:
+                return False
+            await asyncio.sleep(delay)
+
+def per_minute_and_day(max_per_minute: int, max_per_day: int) -> RateLimiter:
+    """Rate limiter for a minute and a daily quota, each over a sliding window"""
+    return RateLimiter([
+        SlidingWindowLimit(max_per_minute, 60.0),
+        SlidingWindowLimit(max_per_day, 86400.0)
+    ])
@@ -0,0 +1,118 @@
+"""
+Adaptive provider routing
+Orders LLM providers per request by expected time to a valid answer,
+learned from exponentially weighted averages of latency, success rate and
+JSON validity. The static priority only breaks ties.
+"""
+
+import os
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# "adaptive" orders by observed performance, "priority" keeps the static order
+LLM_ROUTING = os.getenv("LLM_ROUTING", "adaptive").lower()
+# Weight of the newest sample in each average
+LLM_ROUTING_ALPHA = float(os.getenv("LLM_ROUTING_ALPHA", "0.2"))
+# Assumed latency of a provider with no samples yet
+LLM_ROUTING_PRIOR_LATENCY = float(os.getenv("LLM_ROUTING_PRIOR_LATENCY", "5"))
+# Idle scores drift back to the prior with this half-life, so a provider that
+# had a bad spell gets traffic (and a chance to prove itself) again
+LLM_ROUTING_DECAY_SECONDS = float(os.getenv("LLM_ROUTING_DECAY_SECONDS", "300"))
+# Floor for the success probability, so one bad streak doesn't rank a provider as infinitely slow
+MIN_SUCCESS_PROBABILITY = 0.05
+
+@dataclass
+class ProviderScore:
+    """Running averages for one provider"""
+    latency: float = LLM_ROUTING_PRIOR_LATENCY
+    success_rate: float = 1.0
+    valid_rate: float = 1.0
+    samples: int = 0
+    updated_at: float = field(default_factory=time.monotonic)
+
+    def _decayed(self, value: float, prior: float, now: float) -> float:
+        if LLM_ROUTING_DECAY_SECONDS <= 0:
+            return value
+        weight = 0.5 ** ((now - self.updated_at) / LLM_ROUTING_DECAY_SECONDS)
+        return prior + (value - prior) * weight
+
+    def _current(self, now: float):
+        return (
+            self._decayed(self.latency, LLM_ROUTING_PRIOR_LATENCY, now),
+            self._decayed(self.success_rate, 1.0, now),
+            self._decayed(self.valid_rate, 1.0, now)
+        )
+
+    def _update(self, now: float, latency: Optional[float] = None,
+                success: Optional[bool] = None, valid: Optional[bool] = None):
+        """Fold one observation into the (decayed) averages"""
+        current_latency, current_success, current_valid = self._current(now)
+        if latency is not None:
+            current_latency += LLM_ROUTING_ALPHA * (latency - current_latency)
+        if success is not None:
+            current_success += LLM_ROUTING_ALPHA * (float(success) - current_success)
+        if valid is not None:
+            current_valid += LLM_ROUTING_ALPHA * (float(valid) - current_valid)
+        self.latency, self.success_rate, self.valid_rate = current_latency, current_success, current_valid
+        self.updated_at = now
+
+    def expected_seconds(self, now: Optional[float] = None) -> float:
+        """Expected time until this provider returns a valid answer
+
+        Treating attempts as independent, a call that succeeds and
+        validates with probability p needs 1/p attempts on average.
+        """
+        latency, success_rate, valid_rate = self._current(time.monotonic() if now is None else now)
+        return latency / max(success_rate * valid_rate, MIN_SUCCESS_PROBABILITY)
+
+class ProviderRouter:
+    """Learns provider performance and orders candidates for each request"""
+
+    def __init__(self, mode: str = LLM_ROUTING):
+        self.mode = mode
+        self._scores: Dict[str, ProviderScore] = {}
+
+    def _score(self, name: str) -> ProviderScore:
+        score = self._scores.get(name)
+        if score is None:
+            score = self._scores[name] = ProviderScore()
+        return score
+
+    def record_call(self, name: str, seconds: float, success: bool):
+        """Record a finished provider call; failed calls still tell us how long they took"""
+        score = self._score(name)
+        score._update(time.monotonic(), latency=seconds, success=success)
+        score.samples += 1
+
+    def record_validity(self, name: str, valid: bool):
+        """Record whether a successful answer passed validation"""
+        self._score(name)._update(time.monotonic(), valid=valid)
+
+    def order(self, providers: List[Any]) -> List[Any]:
+        """Providers sorted by expected time to a valid answer, then by static priority"""
+        if self.mode != "adaptive":
+            return sorted(providers, key=lambda provider: provider.config.priority)
+        now = time.monotonic()
+        return sorted(
+            providers,
+            key=lambda provider: (
+                round(self._score(provider.name).expected_seconds(now), 3), provider.config.priority
+            )
+        )
+
+    def snapshot(self, name: str) -> Dict[str, Any]:
+        """Live scores for the status endpoint"""
+        score = self._score(name)
+        now = time.monotonic()
+        latency, success_rate, valid_rate = score._current(now)
+        return {
+            "latency_seconds": round(latency, 3),
+            "success_rate": round(success_rate, 3),
+            "valid_rate": round(valid_rate, 3),
+            "expected_seconds": round(score.expected_seconds(now), 3),
+            "samples": score.samples
+        }
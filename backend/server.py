@@ -1,41 +1,91 @@
 import os
 import io
 import uuid
+import time
+import asyncio
 import logging
+from contextlib import asynccontextmanager
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Depends
+from typing import List, Optional, Tuple, AsyncIterator, Callable
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Depends, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from PIL import Image
-import pytesseract
-import PyPDF2
-import fitz  # PyMuPDF
 import json
 from dotenv import load_dotenv
-from llm_manager import llm_manager
+from llm_manager import llm_manager, user_llm_pool, close_http_client
+from analysis_cache import analysis_cache, make_cache_key
+from extraction import extraction_pool, extract_image_text, extract_pdf_text, ExtractionPoolBusy
+from streaming import sse_event, JsonFieldStreamer
+from metrics import registry, OCR_SECONDS, PDF_EXTRACTION_SECONDS, UPLOAD_BYTES, PROMPT_TOKENS_SAVED, JSON_PARSE_RESULTS
+from text_normalizer import normalize_letter_text, estimate_tokens, fit_to_token_budget
+from prompts import prompt_registry
+from json_parser import parse_json_object, JSONRepairError
+from pipeline import AnalysisPipeline, AnalysisContext
+from single_flight import SingleFlight, prompt_key
+from jobs import job_queue, PermanentJobError, JOB_MAX_FILE_BYTES
+from quota_store import quota_store
+from pymongo.errors import DuplicateKeyError
 from models import (
     UserRegistration, UserLogin, UserProfile, UserInDB, 
-    ApiKeyUpdate, users_collection, UserApiKeys
+    ApiKeyUpdate, users_collection, UserApiKeys, ensure_user_indexes,
+    LOGIN_PROJECTION, PROFILE_PROJECTION, API_KEYS_PROJECTION
 )
 from auth import (
-    hash_password, verify_password, create_access_token, 
-    encrypt_api_key, decrypt_api_key, get_current_user_token,
-    generate_user_id
+    hash_password_async, verify_password_async, password_needs_rehash,
+    create_access_token, encrypt_api_key, decrypt_api_key,
+    get_current_user_token, generate_user_id, password_executor
 )
 import os
 
 # Load environment variables from .env file
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
 
-# Reinitialize LLM manager after loading environment variables
-llm_manager.load_providers()
-
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="German Letter AI Assistant with Multi-LLM Support")
+# Set once the unique email index exists; until then registration checks for duplicates itself
+user_indexes_ready = False
+
+async def start_database_services():
+    """Create indexes, load shared quota usage and start the background analysis workers"""
+    global user_indexes_ready
+    try:
+        await ensure_user_indexes()
+        user_indexes_ready = True
+    except Exception as e:
+        logger.error(f"Failed to create user indexes: {e}")
+    await analysis_cache.ensure_indexes()
+    await quota_store.ensure_indexes()
+    await quota_store.start()
+    await job_queue.ensure_indexes()
+    job_queue.start(run_file_analysis_job)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start services on startup and release them on shutdown"""
+    # Cheap: provider SDKs are imported on each provider's first request
+    llm_manager.load_providers()
+    llm_manager.use_quota_store(quota_store)
+    # These wait on MongoDB, which must not hold up the first request after a cold start
+    database_services = asyncio.create_task(start_database_services())
+    
+    yield
+    
+    database_services.cancel()
+    await asyncio.gather(database_services, return_exceptions=True)
+    await job_queue.stop()
+    # Flush provider quota usage not yet written
+    await quota_store.stop()
+    # Release pooled LLM provider connections, OCR worker processes and password hashing threads
+    await close_http_client()
+    extraction_pool.shutdown()
+    password_executor.shutdown(wait=False)
+
+app = FastAPI(title="German Letter AI Assistant with Multi-LLM Support", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -49,6 +99,7 @@ app.add_middleware(
 class LetterAnalysisRequest(BaseModel):
     text: str
     language: str = "en"
+    bypass_cache: bool = False
 
 class LetterAnalysisResponse(BaseModel):
     analysis: dict
@@ -58,104 +109,138 @@ class LetterAnalysisResponse(BaseModel):
     response_template: Optional[str] = None
     llm_provider: Optional[str] = None
 
-def extract_text_from_image(image_file) -> str:
+async def extract_text_from_image(image_bytes: bytes, wait: bool = False) -> str:
     """Extract text from image using OCR"""
     try:
-        image = Image.open(image_file)
-        # Configure Tesseract for German language
-        custom_config = r'--oem 3 --psm 6 -l deu+eng'
-        text = pytesseract.image_to_string(image, config=custom_config)
-        return text.strip()
+        started = time.perf_counter()
+        text = await extract_image_text(image_bytes, wait)
+        OCR_SECONDS.observe(time.perf_counter() - started)
+        return text
+    except ExtractionPoolBusy as e:
+        logger.warning(f"Rejecting OCR request: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="Text recognition is busy. Please try again in a few seconds.",
+            headers={"Retry-After": "5"}
+        )
+    except BrokenProcessPool:
+        logger.error("OCR worker died while extracting text from image")
+        raise HTTPException(status_code=503, detail="Text recognition failed on our side. Please try again.")
     except Exception as e:
         logger.error(f"Error extracting text from image: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Failed to extract text from image: {str(e)}")
 
-def extract_text_from_pdf(pdf_file) -> str:
+async def extract_text_from_pdf(pdf_bytes: bytes, wait: bool = False) -> str:
     """Extract text from PDF"""
     try:
-        text = ""
-        # Try with PyMuPDF first (better for complex PDFs)
-        try:
-            doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-        except:
-            # Fallback to PyPDF2
-            pdf_file.seek(0)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-        
-        return text.strip()
+        started = time.perf_counter()
+        text = await extract_pdf_text(pdf_bytes, wait)
+        PDF_EXTRACTION_SECONDS.observe(time.perf_counter() - started)
+        return text
+    except ExtractionPoolBusy as e:
+        logger.warning(f"Rejecting PDF request: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="Text extraction is busy. Please try again in a few seconds.",
+            headers={"Retry-After": "5"}
+        )
+    except BrokenProcessPool:
+        logger.error("Extraction worker died while extracting text from PDF")
+        raise HTTPException(status_code=503, detail="Text extraction failed on our side. Please try again.")
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Failed to extract text from PDF: {str(e)}")
 
+async def extract_text_from_upload(file_bytes: bytes, content_type: str, wait: bool = False) -> str:
+    """Extract text from an uploaded image or PDF; wait queues for a worker instead of failing when busy"""
+    if content_type.startswith('image/'):
+        UPLOAD_BYTES.observe(len(file_bytes), kind="image")
+        return await extract_text_from_image(file_bytes, wait)
+    elif content_type == 'application/pdf':
+        UPLOAD_BYTES.observe(len(file_bytes), kind="pdf")
+        return await extract_text_from_pdf(file_bytes, wait)
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Please upload an image or PDF file.")
+
+# Fields an analysis must have; repair can close a truncated answer, but not fill these in
+REQUIRED_ANALYSIS_FIELDS = ("summary", "actions_needed", "deadlines")
+
+def parse_analysis_json(response_text: str) -> Tuple[dict, bool]:
+    """Parse the analysis object from an LLM response, repairing it if needed
+    
+    Returns the object and whether it needed repair.
+    """
+    try:
+        analysis_data, repaired = parse_json_object(response_text)
+    except JSONRepairError:
+        JSON_PARSE_RESULTS.inc(outcome="failed")
+        raise
+    if repaired:
+        logger.info("Repaired malformed JSON in LLM response")
+    JSON_PARSE_RESULTS.inc(outcome="repaired" if repaired else "clean")
+    return analysis_data, repaired
+
+def has_required_fields(analysis_data: dict) -> bool:
+    """Check that an analysis has a summary and its action and deadline lists"""
+    summary = analysis_data.get("summary")
+    return (
+        all(field in analysis_data for field in REQUIRED_ANALYSIS_FIELDS)
+        and isinstance(summary, str) and bool(summary.strip())
+        and isinstance(analysis_data["actions_needed"], list)
+        and isinstance(analysis_data["deadlines"], list)
+    )
+
+def is_valid_analysis_json(response_text: str) -> bool:
+    """Check whether an LLM response contains a complete analysis object
+    
+    Answers that only parse after repair and lack the core fields (e.g.
+    truncated mid-summary) fail, so the next provider gets a chance.
+    """
+    try:
+        analysis_data, _ = parse_json_object(response_text)
+    except JSONRepairError:
+        return False
+    return has_required_fields(analysis_data)
+
 def create_analysis_prompt(text: str, language: str) -> str:
     """Create a comprehensive prompt for LLM to analyze German letters"""
+    return prompt_registry.build(text, language)
+
+def prepare_letter_text(text: str) -> str:
+    """Normalize extracted letter text, logging the estimated tokens saved"""
+    normalized = normalize_letter_text(text)
+    before, after = estimate_tokens(text), estimate_tokens(normalized)
+    if before > after:
+        PROMPT_TOKENS_SAVED.inc(before - after, stage="normalize")
+        logger.info(f"Normalization saved ~{before - after} of {before} estimated tokens")
+    return normalized
+
+def analysis_prompt_fitter(text: str, language: str, context: Optional[AnalysisContext] = None) -> Callable[[int], str]:
+    """Build analysis prompts that fit a provider's input token budget
     
-    language_instructions = {
-        "en": {
-            "analyze_in": "English",
-            "template": """You are an expert assistant helping migrants and refugees understand German official letters. Analyze this German letter and provide a comprehensive response in English.
-
-LETTER TEXT:
-{text}
-
-Please provide a detailed analysis in the following JSON format:
-{{
-    "summary": "Brief summary of what this letter is about",
-    "sender": "Who sent this letter (agency/organization)",
-    "letter_type": "Type of letter (e.g., Jobcenter notification, BAMF decision, etc.)",
-    "main_content": "Main content explanation in simple English",
-    "actions_needed": ["List of specific actions the recipient needs to take"],
-    "deadlines": ["Any important deadlines mentioned with dates"],
-    "documents_required": ["Any documents that need to be submitted"],
-    "consequences": "What happens if no action is taken",
-    "urgency_level": "LOW/MEDIUM/HIGH",
-    "response_template": "A template response letter in German if a response is needed (or null if no response needed)"
-}}
-
-Make sure to:
-1. Explain everything in simple, clear English
-2. Highlight any urgent deadlines
-3. Explain the consequences of not responding
-4. Provide practical next steps
-5. If a response is needed, include a polite German template"""
-        },
-        "ru": {
-            "analyze_in": "Russian",
-            "template": """Вы эксперт-помощник, помогающий мигрантам и беженцам понимать немецкие официальные письма. Проанализируйте это немецкое письмо и предоставьте подробный ответ на русском языке.
-
-ТЕКСТ ПИСЬМА:
-{text}
-
-Предоставьте детальный анализ в следующем JSON формате:
-{{
-    "summary": "Краткое резюме о чем это письмо",
-    "sender": "Кто отправил это письмо (агентство/организация)",
-    "letter_type": "Тип письма (например, уведомление Jobcenter, решение BAMF и т.д.)",
-    "main_content": "Объяснение основного содержания простыми словами на русском",
-    "actions_needed": ["Список конкретных действий, которые нужно предпринять получателю"],
-    "deadlines": ["Любые важные сроки с датами"],
-    "documents_required": ["Любые документы, которые нужно предоставить"],
-    "consequences": "Что произойдет, если не предпринять никаких действий",
-    "urgency_level": "LOW/MEDIUM/HIGH",
-    "response_template": "Шаблон ответного письма на немецком языке, если требуется ответ (или null, если ответ не нужен)"
-}}
-
-Убедитесь, что вы:
-1. Объясняете все простыми, понятными словами на русском
-2. Выделяете срочные сроки
-3. Объясняете последствия неответа
-4. Предоставляете практические следующие шаги
-5. Если нужен ответ, включите вежливый немецкий шаблон"""
-        }
-    }
+    Marks the context as truncated whenever a shortened prompt is handed out.
+    """
+    template_tokens = estimate_tokens(create_analysis_prompt("", language))
+    text_tokens = estimate_tokens(text)
+    prompts = {}
     
-    lang_config = language_instructions.get(language, language_instructions["en"])
-    return lang_config["template"].format(text=text)
+    def fit(max_input_tokens: int) -> str:
+        budget = max(0, max_input_tokens - template_tokens)
+        if text_tokens <= budget:
+            budget = text_tokens
+        if budget not in prompts:
+            fitted = fit_to_token_budget(text, budget)
+            if fitted is not text:
+                saved = text_tokens - estimate_tokens(fitted)
+                PROMPT_TOKENS_SAVED.inc(saved, stage="budget")
+                logger.info(f"Shortened letter by ~{saved} tokens to fit a {max_input_tokens}-token provider")
+            prompts[budget] = (create_analysis_prompt(fitted, language), fitted is not text)
+        prompt, shortened = prompts[budget]
+        if shortened and context is not None:
+            context.truncated = True
+        return prompt
+    
+    return fit
 
 @app.get("/api/health")
 async def health_check():
@@ -171,12 +256,27 @@ async def get_llm_status():
             "status": "success",
             "providers": status,
             "total_providers": len(status),
-            "active_providers": sum(1 for p in status.values() if p["status"] == "active")
+            "active_providers": sum(1 for p in status.values() if p["status"] == "active"),
+            "routing_mode": llm_manager.router.mode,
+            "routing_order": llm_manager.routing_order()
         }
     except Exception as e:
         logger.error(f"Error getting LLM status: {e}")
         return {"status": "error", "message": str(e)}
 
+@app.get("/api/cache-status")
+async def get_cache_status():
+    """Get hit/miss counters of the analysis result cache"""
+    return {"status": "success", "cache": analysis_cache.get_stats()}
+
+registry.gauge("extraction_queue_depth", "Extraction jobs running or waiting", callback=lambda: extraction_pool.pending)
+registry.gauge("llm_user_manager_pool_size", "Per-user LLM managers kept for reuse", callback=lambda: user_llm_pool.size)
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Expose latency histograms and counters in Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/api/test-llm")
 async def test_llm_providers():
     """Test all LLM providers with a simple prompt"""
@@ -186,10 +286,9 @@ async def test_llm_providers():
         results = {}
         for provider in llm_manager.providers:
             try:
-                if provider.can_make_request() and provider.config.status.value == "active":
-                    provider.record_request()
-                    content = await provider.generate_content(test_prompt)
-                    provider.record_success()
+                # Through the manager, so the test counts against the same limits as real requests
+                content = await llm_manager.call_provider(provider, test_prompt)
+                if content is not None:
                     results[provider.name] = {
                         "status": "success",
                         "response": content[:100] + "..." if len(content) > 100 else content
@@ -197,10 +296,10 @@ async def test_llm_providers():
                 else:
                     results[provider.name] = {
                         "status": "skipped",
-                        "reason": "Rate limited or not active"
+                        "reason": "Rate limited, not active or circuit open"
                     }
             except Exception as e:
-                provider.record_error(str(e))
+                # Already recorded against the provider by the manager
                 results[provider.name] = {
                     "status": "error",
                     "error": str(e)
@@ -215,10 +314,215 @@ async def test_llm_providers():
         logger.error(f"Error testing LLM providers: {e}")
         return {"status": "error", "message": str(e)}
 
+# ===============================================
+# ANALYSIS PIPELINE
+# ===============================================
+
+@dataclass
+class FallbackMessages:
+    """How an endpoint words the responses it gives when analysis fails"""
+    retry_actions: List[str]
+    parse_actions: List[str]
+    parse_summary: str = "AI analysis completed but response format was unexpected. Please try again."
+    unavailable_error: str = "All LLM providers failed"
+    unavailable_summary: str = "All AI services are currently unavailable. Please try again later."
+    unavailable_actions: List[str] = field(
+        default_factory=lambda: ["Please try again later when AI services are available"]
+    )
+
+FILE_MESSAGES = FallbackMessages(
+    retry_actions=["Please try uploading the file again"],
+    parse_actions=["Please try uploading the file again", "Check if the document contains clear German text"]
+)
+TEXT_MESSAGES = FallbackMessages(
+    retry_actions=["Please try with different text"],
+    parse_actions=["Please try with different text", "Check if the text contains clear German content"]
+)
+STREAM_MESSAGES = FallbackMessages(retry_actions=["Please try again"], parse_actions=["Please try again"])
+USER_KEY_MESSAGES = FallbackMessages(
+    retry_actions=["Please try again"],
+    parse_actions=["Please try again"],
+    parse_summary="AI analysis completed but response format was unexpected.",
+    unavailable_error="LLM analysis failed",
+    unavailable_summary="AI services are currently unavailable with your API keys.",
+    unavailable_actions=["Please check your API keys in profile settings"]
+)
+
+def _string_list(value) -> List[str]:
+    """Coerce an LLM-provided field into a list of strings"""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    return [item if isinstance(item, str) else json.dumps(item, ensure_ascii=False) for item in value if item is not None]
+
+async def extract_stage(context: AnalysisContext):
+    """Extract text from the upload; text requests skip this"""
+    if context.text is None:
+        text = await extract_text_from_upload(context.file_bytes, context.content_type, context.wait_for_extraction)
+        if not text.strip():
+            raise HTTPException(status_code=400, detail="No text could be extracted from the file")
+        context.text = text
+
+async def normalize_stage(context: AnalysisContext):
+    """Clean OCR noise and page furniture"""
+    context.text = prepare_letter_text(context.text)
+
+async def cache_lookup_stage(context: AnalysisContext):
+    """Serve repeated letters from the analysis cache"""
+    context.cache_key = make_cache_key(context.text, context.language, context.cache_scope)
+    if context.bypass_cache:
+        analysis_cache.record_bypass()
+        return
+    
+    cached_response = await analysis_cache.get(context.cache_key)
+    if cached_response:
+        logger.info(f"Serving {context.endpoint} from cache")
+        context.finish("cache_hit", LetterAnalysisResponse(**cached_response))
+
+# Identical analyses running at the same time share one provider call
+analysis_flights = SingleFlight("analysis")
+registry.gauge(
+    "single_flight_in_flight", "Distinct analysis LLM calls in flight", callback=lambda: analysis_flights.in_flight
+)
+
+async def llm_call_stage(context: AnalysisContext):
+    """Analyze with the Multi-LLM system"""
+    prompt = create_analysis_prompt(context.text, context.language)
+    
+    async def call():
+        response_text, provider = await context.manager.generate_content(
+            prompt, validator=is_valid_analysis_json,
+            fit_prompt=analysis_prompt_fitter(context.text, context.language, context), json_mode=True,
+            prefer=context.preferred_provider
+        )
+        # Joiners share the answer, so they have to learn that it came from a shortened letter too
+        return response_text, provider, context.truncated
+    
+    try:
+        # Scoped per manager: a user's own keys must not answer for the shared ones or vice versa
+        (context.response_text, provider, context.truncated), coalesced = await analysis_flights.do(
+            prompt_key(prompt, scope=str(id(context.manager))), call
+        )
+        if coalesced:
+            logger.info(f"Shared the in-flight analysis from provider: {provider}")
+        context.used_provider = context.provider_label.format(provider=provider)
+        logger.info(f"Successfully analyzed using provider: {provider}")
+    except Exception as e:
+        logger.error(f"All LLM providers failed: {e}")
+        messages = context.messages
+        context.finish("llm_unavailable", LetterAnalysisResponse(
+            analysis={"error": messages.unavailable_error, "details": str(e)},
+            summary=messages.unavailable_summary,
+            actions_needed=messages.unavailable_actions,
+            deadlines=[],
+            response_template=None,
+            llm_provider="none"
+        ))
+
+async def parse_stage(context: AnalysisContext):
+    """Parse the JSON answer, falling back to the raw text"""
+    messages = context.messages
+    if not context.response_text or not context.response_text.strip():
+        logger.error("Empty response from LLM")
+        context.finish("empty_response", LetterAnalysisResponse(
+            analysis={"error": "Empty response from AI"},
+            summary="AI service returned empty response. Please try again.",
+            actions_needed=messages.retry_actions,
+            deadlines=[],
+            response_template=None,
+            llm_provider=context.used_provider
+        ))
+        return
+    
+    logger.info(f"LLM response: {context.response_text[:200]}...")
+    try:
+        context.analysis_data, context.repaired = parse_analysis_json(context.response_text)
+        if not has_required_fields(context.analysis_data):
+            raise ValueError(f"Analysis is missing required fields ({', '.join(REQUIRED_ANALYSIS_FIELDS)})")
+    except ValueError as e:
+        logger.error(f"Failed to parse LLM response as JSON: {str(e)}")
+        logger.error(f"Full response text: {context.response_text}")
+        context.finish("parse_fallback", LetterAnalysisResponse(
+            analysis={
+                "raw_response": context.response_text,
+                "error": "Failed to parse AI response",
+                "summary": "AI provided analysis but in unexpected format"
+            },
+            summary=messages.parse_summary,
+            actions_needed=messages.parse_actions,
+            deadlines=[],
+            response_template=None,
+            llm_provider=context.used_provider
+        ))
+
+async def validate_stage(context: AnalysisContext):
+    """Coerce fields of the wrong type so a usable answer doesn't fail response validation"""
+    data = context.analysis_data
+    if "summary" in data and not isinstance(data["summary"], str):
+        data["summary"] = json.dumps(data["summary"], ensure_ascii=False)
+    for key in ("actions_needed", "deadlines"):
+        if key in data and not (isinstance(data[key], list) and all(isinstance(item, str) for item in data[key])):
+            data[key] = _string_list(data[key])
+    template = data.get("response_template")
+    if template is not None and not isinstance(template, str):
+        data["response_template"] = json.dumps(template, ensure_ascii=False)
+
+async def respond_stage(context: AnalysisContext):
+    """Build the response and remember it in the cache unless it needed repair or truncation"""
+    data = context.analysis_data
+    analysis_response = LetterAnalysisResponse(
+        analysis=data,
+        summary=data.get("summary") or "Analysis completed",
+        actions_needed=data.get("actions_needed") or [],
+        deadlines=data.get("deadlines") or [],
+        response_template=data.get("response_template"),
+        llm_provider=context.used_provider
+    )
+    if context.repaired:
+        # Usable, but possibly cut short; let the next request try for a clean answer
+        context.finish("repaired", analysis_response)
+        return
+    if context.truncated:
+        # An answer about part of the letter; a provider with room for all of it may be free next time
+        context.finish("truncated", analysis_response)
+        return
+    await analysis_cache.set(context.cache_key, analysis_response.dict(), context.language)
+    context.finish("success", analysis_response)
+
+analysis_pipeline = AnalysisPipeline([
+    ("extract", extract_stage),
+    ("normalize", normalize_stage),
+    ("cache_lookup", cache_lookup_stage),
+    ("llm_call", llm_call_stage),
+    ("parse", parse_stage),
+    ("validate", validate_stage),
+    ("respond", respond_stage)
+])
+
+async def analyze_file_content(
+    file_bytes: bytes,
+    content_type: str,
+    language: str,
+    bypass_cache: bool = False
+) -> AnalysisContext:
+    """Extract text from an uploaded file and analyze it"""
+    return await analysis_pipeline.run(AnalysisContext(
+        language=language,
+        endpoint="analyze_file",
+        bypass_cache=bypass_cache,
+        file_bytes=file_bytes,
+        content_type=content_type,
+        manager=llm_manager,
+        messages=FILE_MESSAGES
+    ))
+
 @app.post("/api/analyze-file", response_model=LetterAnalysisResponse)
 async def analyze_file(
+    response: Response,
     file: UploadFile = File(...),
-    language: str = Form(default="en")
+    language: str = Form(default="en"),
+    bypass_cache: bool = Form(default=False)
 ):
     """Analyze uploaded file (image or PDF) and extract letter information"""
     
@@ -227,203 +531,357 @@ async def analyze_file(
         if not file.content_type:
             raise HTTPException(status_code=400, detail="File content type not specified")
         
-        # Extract text based on file type
-        if file.content_type.startswith('image/'):
-            text = extract_text_from_image(file.file)
-        elif file.content_type == 'application/pdf':
-            text = extract_text_from_pdf(file.file)
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type. Please upload an image or PDF file.")
-        
-        if not text.strip():
-            raise HTTPException(status_code=400, detail="No text could be extracted from the file")
-        
-        # Analyze with Multi-LLM system
-        prompt = create_analysis_prompt(text, language)
-        
-        try:
-            response_text, used_provider = await llm_manager.generate_content(prompt)
-            logger.info(f"Successfully analyzed using provider: {used_provider}")
-        except Exception as e:
-            logger.error(f"All LLM providers failed: {e}")
-            return LetterAnalysisResponse(
-                analysis={"error": "All LLM providers failed", "details": str(e)},
-                summary="All AI services are currently unavailable. Please try again later.",
-                actions_needed=["Please try again later when AI services are available"],
-                deadlines=[],
-                response_template=None,
-                llm_provider="none"
-            )
-        
-        # Parse the JSON response
-        try:
-            # Check if response is empty
-            if not response_text or response_text.strip() == "":
-                logger.error("Empty response from LLM")
-                return LetterAnalysisResponse(
-                    analysis={"error": "Empty response from AI"},
-                    summary="AI service returned empty response. Please try again.",
-                    actions_needed=["Please try uploading the file again"],
-                    deadlines=[],
-                    response_template=None,
-                    llm_provider=used_provider
-                )
-            
-            # Extract JSON from response
-            logger.info(f"LLM response: {response_text[:200]}...")
-            
-            # Try to find JSON in the response
-            json_text = response_text
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                if json_end > json_start:
-                    json_text = response_text[json_start:json_end].strip()
-            elif response_text.startswith("{"):
-                # Already looks like JSON
-                json_text = response_text
-            else:
-                # Try to extract JSON from the response
-                start_idx = response_text.find("{")
-                end_idx = response_text.rfind("}")
-                if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                    json_text = response_text[start_idx:end_idx+1]
-                else:
-                    raise json.JSONDecodeError("No JSON found in response", response_text, 0)
-            
-            logger.info(f"Attempting to parse JSON: {json_text[:200]}...")
-            analysis_data = json.loads(json_text)
-            
-            # Validate required fields
-            if not isinstance(analysis_data, dict):
-                raise ValueError("Response is not a valid JSON object")
-            
-            return LetterAnalysisResponse(
-                analysis=analysis_data,
-                summary=analysis_data.get("summary", "Analysis completed"),
-                actions_needed=analysis_data.get("actions_needed", []),
-                deadlines=analysis_data.get("deadlines", []),
-                response_template=analysis_data.get("response_template"),
-                llm_provider=used_provider
-            )
-            
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.error(f"Failed to parse LLM response as JSON: {str(e)}")
-            logger.error(f"Full response text: {response_text}")
-            
-            # Fallback: return structured response with raw text
-            return LetterAnalysisResponse(
-                analysis={
-                    "raw_response": response_text,
-                    "error": "Failed to parse AI response",
-                    "summary": "AI provided analysis but in unexpected format"
-                },
-                summary="AI analysis completed but response format was unexpected. Please try again.",
-                actions_needed=["Please try uploading the file again", "Check if the document contains clear German text"],
-                deadlines=[],
-                response_template=None,
-                llm_provider=used_provider
-            )
+        context = await analyze_file_content(await file.read(), file.content_type, language, bypass_cache)
+        response.headers["Server-Timing"] = context.server_timing()
+        return context.response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error analyzing file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to analyze file: {str(e)}")
 
 @app.post("/api/analyze-text", response_model=LetterAnalysisResponse)
-async def analyze_text(request: LetterAnalysisRequest):
+async def analyze_text(request: LetterAnalysisRequest, response: Response):
     """Analyze text directly without file upload"""
     
     try:
-        prompt = create_analysis_prompt(request.text, request.language)
-        
-        try:
-            response_text, used_provider = await llm_manager.generate_content(prompt)
-            logger.info(f"Successfully analyzed using provider: {used_provider}")
-        except Exception as e:
-            logger.error(f"All LLM providers failed: {e}")
-            return LetterAnalysisResponse(
-                analysis={"error": "All LLM providers failed", "details": str(e)},
-                summary="All AI services are currently unavailable. Please try again later.",
-                actions_needed=["Please try again later when AI services are available"],
-                deadlines=[],
-                response_template=None,
-                llm_provider="none"
-            )
-        
-        # Parse the JSON response
-        try:
-            # Check if response is empty
-            if not response_text or response_text.strip() == "":
-                logger.error("Empty response from LLM")
-                return LetterAnalysisResponse(
-                    analysis={"error": "Empty response from AI"},
-                    summary="AI service returned empty response. Please try again.",
-                    actions_needed=["Please try with different text"],
-                    deadlines=[],
-                    response_template=None,
-                    llm_provider=used_provider
-                )
-            
-            # Extract JSON from response
-            logger.info(f"LLM response: {response_text[:200]}...")
-            
-            # Try to find JSON in the response
-            json_text = response_text
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                if json_end > json_start:
-                    json_text = response_text[json_start:json_end].strip()
-            elif response_text.startswith("{"):
-                # Already looks like JSON
-                json_text = response_text
-            else:
-                # Try to extract JSON from the response
-                start_idx = response_text.find("{")
-                end_idx = response_text.rfind("}")
-                if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                    json_text = response_text[start_idx:end_idx+1]
-                else:
-                    raise json.JSONDecodeError("No JSON found in response", response_text, 0)
-            
-            logger.info(f"Attempting to parse JSON: {json_text[:200]}...")
-            analysis_data = json.loads(json_text)
-            
-            # Validate required fields
-            if not isinstance(analysis_data, dict):
-                raise ValueError("Response is not a valid JSON object")
-            
-            return LetterAnalysisResponse(
-                analysis=analysis_data,
-                summary=analysis_data.get("summary", "Analysis completed"),
-                actions_needed=analysis_data.get("actions_needed", []),
-                deadlines=analysis_data.get("deadlines", []),
-                response_template=analysis_data.get("response_template"),
-                llm_provider=used_provider
-            )
-            
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.error(f"Failed to parse LLM response as JSON: {str(e)}")
-            logger.error(f"Full response text: {response_text}")
-            
-            # Fallback: return structured response with raw text
-            return LetterAnalysisResponse(
-                analysis={
-                    "raw_response": response_text,
-                    "error": "Failed to parse AI response",
-                    "summary": "AI provided analysis but in unexpected format"
-                },
-                summary="AI analysis completed but response format was unexpected. Please try again.",
-                actions_needed=["Please try with different text", "Check if the text contains clear German content"],
-                deadlines=[],
-                response_template=None,
-                llm_provider=used_provider
-            )
+        context = await analysis_pipeline.run(AnalysisContext(
+            language=request.language,
+            endpoint="analyze_text",
+            bypass_cache=request.bypass_cache,
+            text=request.text,
+            manager=llm_manager,
+            messages=TEXT_MESSAGES
+        ))
+        response.headers["Server-Timing"] = context.server_timing()
+        return context.response
         
     except Exception as e:
         logger.error(f"Error analyzing text: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to analyze text: {str(e)}")
 
+# ===============================================
+# STREAMING ANALYSIS ENDPOINTS
+# ===============================================
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+async def stream_analysis(
+    language: str,
+    bypass_cache: bool,
+    text: Optional[str] = None,
+    file_bytes: Optional[bytes] = None,
+    content_type: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Run an analysis and report its progress as server-sent events
+    
+    Events: "stage" for pipeline progress, "token" for raw LLM output,
+    "field" for each top-level JSON field once complete, "timing" with
+    the stage durations in milliseconds, then a final "result" with the
+    full LetterAnalysisResponse, or "error".
+    
+    Uses the analysis pipeline, with the LLM call stage replaced by
+    token streaming.
+    """
+    context = AnalysisContext(
+        language=language,
+        endpoint="analyze_stream",
+        bypass_cache=bypass_cache,
+        text=text,
+        file_bytes=file_bytes,
+        content_type=content_type,
+        manager=llm_manager,
+        messages=STREAM_MESSAGES
+    )
+    try:
+        if text is None:
+            yield sse_event("stage", {"stage": "extracting"})
+        await analysis_pipeline.run(context, stop="cache_lookup")
+        yield sse_event("stage", {"stage": "extraction_done", "characters": len(context.text)})
+        
+        await analysis_pipeline.run(context, start="cache_lookup", stop="llm_call")
+        if context.response is not None:
+            yield sse_event("stage", {"stage": "cache_hit"})
+            yield sse_event("result", context.response.dict())
+            return
+        
+        field_streamer = JsonFieldStreamer()
+        chunks = []
+        used_provider = "none"
+        
+        with context.timed("llm_call"):
+            async for kind, value in context.manager.stream_content(
+                create_analysis_prompt(context.text, language),
+                fit_prompt=analysis_prompt_fitter(context.text, language, context),
+                json_mode=True
+            ):
+                if kind == "provider":
+                    # A new provider means the previous one failed before sending anything
+                    used_provider = value
+                    field_streamer = JsonFieldStreamer()
+                    chunks = []
+                    yield sse_event("stage", {"stage": "provider_selected", "provider": value})
+                    continue
+                
+                chunks.append(value)
+                yield sse_event("token", {"text": value})
+                for name, field_value in field_streamer.feed(value):
+                    yield sse_event("field", {"name": name, "value": field_value})
+        
+        context.response_text = "".join(chunks).strip()
+        context.used_provider = used_provider
+        await analysis_pipeline.run(context, start="parse")
+        yield sse_event("timing", {stage: round(seconds * 1000, 1) for stage, seconds in context.timings.items()})
+        yield sse_event("result", context.response.dict())
+        
+    except HTTPException as e:
+        yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+    except Exception as e:
+        logger.error(f"Error streaming analysis: {str(e)}")
+        yield sse_event("error", {"status_code": 500, "detail": f"Failed to analyze letter: {str(e)}"})
+
+@app.post("/api/analyze-text/stream")
+async def analyze_text_stream(request: LetterAnalysisRequest):
+    """Analyze text and stream progress, tokens and fields as server-sent events"""
+    return StreamingResponse(
+        stream_analysis(request.language, request.bypass_cache, text=request.text),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@app.post("/api/analyze-file/stream")
+async def analyze_file_stream(
+    file: UploadFile = File(...),
+    language: str = Form(default="en"),
+    bypass_cache: bool = Form(default=False)
+):
+    """Analyze an uploaded file and stream progress, tokens and fields as server-sent events"""
+    if not file.content_type:
+        raise HTTPException(status_code=400, detail="File content type not specified")
+    if not (file.content_type.startswith('image/') or file.content_type == 'application/pdf'):
+        raise HTTPException(status_code=400, detail="Unsupported file type. Please upload an image or PDF file.")
+    
+    file_bytes = await file.read()
+    return StreamingResponse(
+        stream_analysis(language, bypass_cache, file_bytes=file_bytes, content_type=file.content_type),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+# ===============================================
+# BATCH ANALYSIS ENDPOINTS
+# ===============================================
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+# Uploads are held in memory until the batch is done, so cap each file and the whole batch
+BATCH_MAX_FILE_BYTES = int(os.getenv("BATCH_MAX_FILE_BYTES", str(10 * 1024 * 1024)))
+BATCH_MAX_TOTAL_BYTES = int(os.getenv("BATCH_MAX_TOTAL_BYTES", str(50 * 1024 * 1024)))
+
+# Shared by all batch requests, so several large batches can't flood the providers
+batch_semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+@dataclass
+class BatchItem:
+    """One file or text of a batch request"""
+    index: int
+    name: str
+    text: Optional[str] = None
+    file_bytes: Optional[bytes] = None
+    content_type: Optional[str] = None
+    error: Optional[str] = None
+
+async def analyze_batch_item(item: BatchItem, language: str, bypass_cache: bool, preferred_provider: Optional[str]) -> dict:
+    """Analyze one batch item; failures become an error line instead of failing the batch"""
+    line = {"index": item.index, "name": item.name}
+    if item.error:
+        return {**line, "status": "error", "status_code": 400, "detail": item.error}
+    
+    try:
+        async with batch_semaphore:
+            context = await analysis_pipeline.run(AnalysisContext(
+                language=language,
+                endpoint="analyze_batch",
+                bypass_cache=bypass_cache,
+                text=item.text,
+                file_bytes=item.file_bytes,
+                content_type=item.content_type,
+                manager=llm_manager,
+                messages=TEXT_MESSAGES if item.text is not None else FILE_MESSAGES,
+                preferred_provider=preferred_provider,
+                # The batch's own items would otherwise fill the queue and come back as "busy"
+                wait_for_extraction=True
+            ))
+    except HTTPException as e:
+        return {**line, "status": "error", "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        logger.error(f"Error analyzing batch item {item.index}: {str(e)}")
+        return {**line, "status": "error", "status_code": 500, "detail": f"Failed to analyze letter: {str(e)}"}
+    
+    return {
+        **line,
+        "status": "ok",
+        "outcome": context.outcome,
+        "result": context.response.dict(),
+        "timings": {stage: round(seconds * 1000, 1) for stage, seconds in context.timings.items()}
+    }
+
+async def stream_batch(items: List[BatchItem], language: str, bypass_cache: bool) -> AsyncIterator[str]:
+    """Analyze batch items concurrently and yield one NDJSON line per item as it finishes
+    
+    Items are assigned round-robin to the providers that can take requests
+    now, so a batch spreads over all their quotas instead of draining the
+    first one; normal fallback still applies per item.
+    """
+    providers = [provider.name for provider in llm_manager.eligible_providers()]
+    tasks = [
+        asyncio.create_task(analyze_batch_item(
+            item, language, bypass_cache, providers[item.index % len(providers)] if providers else None
+        ))
+        for item in items
+    ]
+    failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            if line["status"] != "ok":
+                failed += 1
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+        yield json.dumps({"summary": {"total": len(items), "succeeded": len(items) - failed, "failed": failed}}) + "\n"
+    finally:
+        # The client went away; don't keep analyzing for nobody
+        for task in tasks:
+            task.cancel()
+
+@app.post("/api/analyze-batch")
+async def analyze_batch(
+    files: List[UploadFile] = File(default=[]),
+    texts: List[str] = Form(default=[]),
+    language: str = Form(default="en"),
+    bypass_cache: bool = Form(default=False)
+):
+    """Analyze many files and texts at once, streaming results as NDJSON
+    
+    Each line is one item's result or error, in completion order and tagged
+    with the item's index (files first, then texts); the last line is a
+    summary.
+    """
+    if not files and not texts:
+        raise HTTPException(status_code=400, detail="No files or texts provided")
+    if len(files) + len(texts) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {BATCH_MAX_ITEMS} items")
+    
+    # Read uploads now: they are closed once the streaming response starts
+    items = []
+    total_bytes = 0
+    batch_too_large = HTTPException(
+        status_code=413, detail=f"A batch can contain at most {BATCH_MAX_TOTAL_BYTES} bytes of files and texts"
+    )
+    for file in files:
+        item = BatchItem(index=len(items), name=file.filename or f"file-{len(items)}", content_type=file.content_type)
+        if not file.content_type or not (file.content_type.startswith('image/') or file.content_type == 'application/pdf'):
+            item.error = "Unsupported file type. Please upload an image or PDF file."
+        else:
+            # One byte more than allowed is enough to tell an oversized file
+            item.file_bytes = await file.read(BATCH_MAX_FILE_BYTES + 1)
+            if len(item.file_bytes) > BATCH_MAX_FILE_BYTES:
+                item.file_bytes = None
+                item.error = "File is too large"
+            else:
+                total_bytes += len(item.file_bytes)
+                if total_bytes > BATCH_MAX_TOTAL_BYTES:
+                    raise batch_too_large
+        items.append(item)
+    for text in texts:
+        item = BatchItem(index=len(items), name=f"text-{len(items)}", text=text)
+        if not text.strip():
+            item.error = "Text is empty"
+        total_bytes += len(text.encode("utf-8"))
+        if total_bytes > BATCH_MAX_TOTAL_BYTES:
+            raise batch_too_large
+        items.append(item)
+    
+    return StreamingResponse(
+        stream_batch(items, language, bypass_cache),
+        media_type="application/x-ndjson",
+        headers=SSE_HEADERS
+    )
+
+# ===============================================
+# BACKGROUND JOB ENDPOINTS
+# ===============================================
+
+JOB_MAX_WAIT_SECONDS = 30
+
+async def run_file_analysis_job(payload: dict) -> dict:
+    """Job handler: analyze a stored upload"""
+    try:
+        context = await analyze_file_content(
+            payload["file"], payload["content_type"], payload["language"], payload.get("bypass_cache", False)
+        )
+    except HTTPException as e:
+        # Busy extraction workers are worth retrying; bad uploads are not
+        if 400 <= e.status_code < 500:
+            raise PermanentJobError(e.detail)
+        raise Exception(e.detail)
+    return context.response.dict()
+
+def job_to_response(job: dict) -> dict:
+    """Public view of a job document"""
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "attempts": job.get("attempts", 0),
+        "created_at": job.get("created_at"),
+        "finished_at": job.get("finished_at"),
+        "result": job.get("result"),
+        "error": job.get("error")
+    }
+
+@app.post("/api/jobs/analyze-file", status_code=202)
+async def create_file_analysis_job(
+    file: UploadFile = File(...),
+    language: str = Form(default="en"),
+    bypass_cache: bool = Form(default=False)
+):
+    """Queue an uploaded file for background analysis and return its job id"""
+    if not file.content_type:
+        raise HTTPException(status_code=400, detail="File content type not specified")
+    if not (file.content_type.startswith('image/') or file.content_type == 'application/pdf'):
+        raise HTTPException(status_code=400, detail="Unsupported file type. Please upload an image or PDF file.")
+    
+    file_bytes = await file.read()
+    if len(file_bytes) > JOB_MAX_FILE_BYTES:
+        raise HTTPException(status_code=413, detail="File is too large")
+    
+    try:
+        job_id = await job_queue.enqueue({
+            "file": file_bytes,
+            "filename": file.filename,
+            "content_type": file.content_type,
+            "language": language,
+            "bypass_cache": bypass_cache
+        })
+    except Exception as e:
+        logger.error(f"Error queueing analysis job: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue analysis: {str(e)}")
+    
+    return {"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}"}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(default=0, ge=0, le=JOB_MAX_WAIT_SECONDS)):
+    """Get a job's status and result; with wait > 0, long-poll until it finishes"""
+    try:
+        job = await job_queue.wait(job_id, wait) if wait else await job_queue.get(job_id)
+    except Exception as e:
+        logger.error(f"Error getting job {job_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get job: {str(e)}")
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_to_response(job)
+
 # ===============================================
 # USER MANAGEMENT AND API KEY ENDPOINTS
 # ===============================================
@@ -432,13 +890,14 @@ async def analyze_text(request: LetterAnalysisRequest):
 async def register_user(user_data: UserRegistration):
     """Register a new user with optional API keys"""
     try:
-        # Check if user already exists
-        existing_user = await users_collection.find_one({"email": user_data.email})
-        if existing_user:
+        # The unique email index rejects duplicates, but it is built in the background
+        # after startup (and not at all on a database that already has duplicates);
+        # until it exists, check for an existing user first
+        if not user_indexes_ready and await users_collection.find_one({"email": user_data.email}, {"_id": 1}):
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # Hash password
-        password_hash = hash_password(user_data.password)
+        password_hash = await hash_password_async(user_data.password)
         
         # Encrypt API keys if provided
         encrypted_api_keys = {}
@@ -461,8 +920,11 @@ async def register_user(user_data: UserRegistration):
             "is_active": True
         }
         
-        # Insert user into database
-        result = await users_collection.insert_one(user_doc)
+        # Insert user into database; the unique email index catches concurrent registrations
+        try:
+            await users_collection.insert_one(user_doc)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="Email already registered")
         
         # Create access token
         access_token = create_access_token(data={"sub": user_id, "email": user_data.email})
@@ -489,22 +951,25 @@ async def login_user(login_data: UserLogin):
     """Login user and return access token"""
     try:
         # Find user by email
-        user = await users_collection.find_one({"email": login_data.email})
+        user = await users_collection.find_one({"email": login_data.email}, LOGIN_PROJECTION)
         if not user:
             raise HTTPException(status_code=401, detail="Invalid email or password")
         
         # Verify password
-        if not verify_password(login_data.password, user["password_hash"]):
+        if not await verify_password_async(login_data.password, user["password_hash"]):
             raise HTTPException(status_code=401, detail="Invalid email or password")
         
         # Check if user is active
         if not user.get("is_active", True):
             raise HTTPException(status_code=401, detail="Account is disabled")
         
-        # Update last login
+        # Update last login, upgrading the hash if the configured work factor changed
+        login_update = {"last_login": datetime.utcnow()}
+        if password_needs_rehash(user["password_hash"]):
+            login_update["password_hash"] = await hash_password_async(login_data.password)
         await users_collection.update_one(
             {"id": user["id"]},
-            {"$set": {"last_login": datetime.utcnow()}}
+            {"$set": login_update}
         )
         
         # Create access token
@@ -531,7 +996,7 @@ async def login_user(login_data: UserLogin):
 async def get_user_profile(current_user: dict = Depends(get_current_user_token)):
     """Get current user profile"""
     try:
-        user = await users_collection.find_one({"id": current_user["sub"]})
+        user = await users_collection.find_one({"id": current_user["sub"]}, PROFILE_PROJECTION)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -607,12 +1072,13 @@ async def update_api_keys(api_key_data: ApiKeyUpdate, current_user: dict = Depen
 @app.post("/api/analyze-text-with-user-keys", response_model=LetterAnalysisResponse)
 async def analyze_text_with_user_keys(
     request: LetterAnalysisRequest, 
+    response: Response,
     current_user: dict = Depends(get_current_user_token)
 ):
     """Analyze text using user's personal API keys"""
     try:
         # Get user's API keys
-        user = await users_collection.find_one({"id": current_user["sub"]})
+        user = await users_collection.find_one({"id": current_user["sub"]}, API_KEYS_PROJECTION)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -630,71 +1096,27 @@ async def analyze_text_with_user_keys(
                 detail="No API keys configured. Please add your API keys in profile settings."
             )
         
-        # Create a temporary LLM manager with user's keys
-        # This would require modifying the LLM manager to accept custom keys
-        # For now, we'll use the existing analyze endpoint
-        # TODO: Implement user-specific LLM manager
-        
-        # Fallback to default analysis for now
-        prompt = create_analysis_prompt(request.text, request.language)
-        
-        try:
-            response_text, used_provider = await llm_manager.generate_content(prompt)
-            logger.info(f"Successfully analyzed using provider: {used_provider}")
-        except Exception as e:
-            logger.error(f"All LLM providers failed: {e}")
-            return LetterAnalysisResponse(
-                analysis={"error": "LLM analysis failed", "details": str(e)},
-                summary="AI services are currently unavailable with your API keys.",
-                actions_needed=["Please check your API keys in profile settings"],
-                deadlines=[],
-                response_template=None,
-                llm_provider="none"
+        # Reuse the pooled LLM manager built from the user's keys
+        user_manager = user_llm_pool.get(user["id"], user_api_keys)
+        if not user_manager.providers:
+            raise HTTPException(
+                status_code=400,
+                detail="None of your API keys could be used. Please check them in profile settings."
             )
         
-        # Parse response (same logic as original analyze_text endpoint)
-        try:
-            json_text = response_text
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                if json_end > json_start:
-                    json_text = response_text[json_start:json_end].strip()
-            elif response_text.startswith("{"):
-                json_text = response_text
-            else:
-                start_idx = response_text.find("{")
-                end_idx = response_text.rfind("}")
-                if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                    json_text = response_text[start_idx:end_idx+1]
-                else:
-                    raise json.JSONDecodeError("No JSON found in response", response_text, 0)
-            
-            analysis_data = json.loads(json_text)
-            
-            return LetterAnalysisResponse(
-                analysis=analysis_data,
-                summary=analysis_data.get("summary", "Analysis completed"),
-                actions_needed=analysis_data.get("actions_needed", []),
-                deadlines=analysis_data.get("deadlines", []),
-                response_template=analysis_data.get("response_template"),
-                llm_provider=f"{used_provider} (user's key)"
-            )
-            
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.error(f"Failed to parse LLM response as JSON: {str(e)}")
-            return LetterAnalysisResponse(
-                analysis={
-                    "raw_response": response_text,
-                    "error": "Failed to parse AI response",
-                    "summary": "AI provided analysis but in unexpected format"
-                },
-                summary="AI analysis completed but response format was unexpected.",
-                actions_needed=["Please try again"],
-                deadlines=[],
-                response_template=None,
-                llm_provider=f"{used_provider} (user's key)"
-            )
+        context = await analysis_pipeline.run(AnalysisContext(
+            language=request.language,
+            endpoint="analyze_user_keys",
+            bypass_cache=request.bypass_cache,
+            text=request.text,
+            manager=user_manager,
+            messages=USER_KEY_MESSAGES,
+            provider_label="{provider} (user's key)",
+            # Paid for with the user's keys: neither served from nor shared with the public cache
+            cache_scope=f"user:{user['id']}"
+        ))
+        response.headers["Server-Timing"] = context.server_timing()
+        return context.response
         
     except HTTPException:
         raise
@@ -0,0 +1,87 @@
+"""
+Single-flight calls
+Concurrent callers asking for the same key share one in-flight call
+instead of each starting their own, e.g. when a client retries a slow
+analysis or several tabs submit the same letter
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from metrics import SINGLE_FLIGHT_CALLS
+
+logger = logging.getLogger(__name__)
+
+# Off runs every call on its own, e.g. for benchmarks that repeat the same letters
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+def prompt_key(prompt: str, scope: str = "") -> str:
+    """Key for a prompt; scope keeps callers that must not share results apart"""
+    return hashlib.sha256(f"{scope}\n{prompt}".encode("utf-8")).hexdigest()
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key
+
+    The call runs as its own task, so the caller that started it can go
+    away without failing the others; it is cancelled only once nobody is
+    waiting for it any more. Results are not kept after the call finishes.
+    """
+
+    def __init__(self, name: str, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self._calls: Dict[str, _Call] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run fn, or join the call already running for key
+
+        Returns the result and whether it came from another caller's call.
+        Every waiter sees the same exception if the call fails.
+        """
+        if not self.enabled:
+            return await fn(), False
+
+        call = self._calls.get(key)
+        if call is not None and call.task.cancelled():
+            # Cancelled but its done callback hasn't run yet; don't inherit the cancellation
+            call = None
+        coalesced = call is not None
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            logger.info(f"Joining in-flight {self.name} call")
+        SINGLE_FLIGHT_CALLS.inc(group=self.name, role="coalesced" if coalesced else "leader")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), coalesced
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller went away (e.g. clients disconnected); forget the call
+                # first so a caller arriving now starts a fresh one instead of joining it
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if call.task.cancelled():
+            return
+        # Mark the exception as retrieved when nobody was left to await it
+        call.task.exception()
@@ -0,0 +1,81 @@
+"""
+Streaming helpers
+Server-sent event formatting and early detection of completed top-level
+fields while an LLM response is still streaming in
+"""
+
+import json
+from typing import Any, List, Optional, Tuple
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+class JsonFieldStreamer:
+    """Emit top-level fields of a streamed JSON object as soon as each value is complete
+
+    Text before the first "{" (such as a ```json fence) is ignored. Scanning is
+    incremental, so each character is looked at once however the chunks are split.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Add streamed text and return the fields completed by it"""
+        self._text += chunk
+        fields = []
+        text = self._text
+
+        while self._pos < len(text) and not self._finished:
+            ch = text[self._pos]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._member_start = self._pos + 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finished = True
+                    self._emit_member(self._pos, fields)
+            elif ch == "," and self._depth == 1:
+                self._emit_member(self._pos, fields)
+                self._member_start = self._pos + 1
+            self._pos += 1
+
+        return fields
+
+    def _emit_member(self, end: int, fields: List[Tuple[str, Any]]):
+        field = self._parse_member(self._text[self._member_start:end])
+        if field is not None:
+            fields.append(field)
+
+    @staticmethod
+    def _parse_member(member: str) -> Optional[Tuple[str, Any]]:
+        member = member.strip()
+        if not member:
+            return None
+        try:
+            parsed = json.loads("{" + member + "}")
+        except ValueError:
+            return None
+        return next(iter(parsed.items()), None)
@@ -0,0 +1,61 @@
+"""
+Rate limiter tests
+Run from backend/: python -m pytest tests
+"""
+
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import RateLimiter, SlidingWindowLimit, per_minute_and_day
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def admit_greedily(limiter: RateLimiter, clock: FakeClock, seconds: float, step: float = 0.1):
+    """Start a request whenever the limiter allows one; returns the start times"""
+    started = []
+    end = clock.now + seconds
+    while clock.now < end:
+        while limiter.wait_time() == 0:
+            limiter.consume()
+            started.append(clock.now)
+        clock.now += step
+    return started
+
+def test_no_minute_window_exceeds_max_per_minute():
+    clock = FakeClock()
+    limiter = RateLimiter([SlidingWindowLimit(15, 60.0, clock), SlidingWindowLimit(1000, 86400.0, clock)])
+    started = admit_greedily(limiter, clock, 300)
+    assert len(started) == 75
+    for i, start in enumerate(started):
+        in_window = [t for t in started[i:] if t < start + 60.0]
+        assert len(in_window) <= 15
+
+def test_daily_limit_holds_across_minutes():
+    clock = FakeClock()
+    limiter = RateLimiter([SlidingWindowLimit(15, 60.0, clock), SlidingWindowLimit(20, 86400.0, clock)])
+    assert len(admit_greedily(limiter, clock, 600, step=1.0)) == 20
+    assert limiter.wait_time() > 3600
+
+def test_wait_time_points_at_the_oldest_request_leaving_the_window():
+    clock = FakeClock()
+    limit = SlidingWindowLimit(2, 60.0, clock)
+    limit.consume()
+    clock.now += 10
+    limit.consume()
+    assert limit.wait_time() == 50.0
+    clock.now += 50
+    assert limit.wait_time() == 0.0
+
+def test_wait_respects_deadline():
+    limiter = per_minute_and_day(1, 100)
+    limiter.consume()
+    assert asyncio.run(limiter.wait(0.05)) is False
+    assert asyncio.run(per_minute_and_day(1, 100).wait(0.05)) is True
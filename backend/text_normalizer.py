@@ -0,0 +1,140 @@
+"""
+Letter text normalization
+Cleans OCR/PDF text before it goes into a prompt and fits it to a
+provider's input token budget
+"""
+
+import re
+import math
+import unicodedata
+from collections import Counter
+from typing import List, Set
+
+# Local token estimate: German compounds split into roughly 4-character pieces
+CHARS_PER_TOKEN_PIECE = 4
+
+# A line among the first or last PAGE_EDGE_LINES lines of at least
+# PAGE_FURNITURE_MIN_PAGES pages is a header or footer
+PAGE_EDGE_LINES = 3
+PAGE_FURNITURE_MIN_PAGES = 2
+
+TRUNCATION_MARKER = "\n[...]\n"
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_HYPHENATION_RE = re.compile(r"(\w)-\n[ \t]*([a-zäöüß]\w*)")
+_PAGE_NUMBER_RE = re.compile(r"^(seite|page|blatt)?\s*\d+\s*(von|/|of)\s*\d+$|^-\s*\d+\s*-$", re.IGNORECASE)
+# Company registration footers; bank lines are kept because letters often ask for a payment
+_BOILERPLATE_RE = re.compile(
+    r"^(sitz der gesellschaft|registergericht|amtsgericht\b.*\bhr[ab]\b|handelsregister|ust-?id|"
+    r"steuer-?nr|geschäftsführ|vorstand:|aufsichtsrat)",
+    re.IGNORECASE
+)
+# Joining "Kranken-\nund" would be wrong: the hyphen marks an elided compound part
+_COORDINATING_WORDS = {"und", "oder", "bzw", "sowie"}
+
+_CHARACTER_FIXES = str.maketrans({
+    "\u00ad": "",    # soft hyphen
+    "\ufb01": "fi",  # ligatures
+    "\ufb02": "fl",
+    "\u2010": "-",   # unicode hyphens
+    "\u2011": "-",
+    "\u00a0": " "    # no-break space
+})
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without a tokenizer; errs on the high side for German"""
+    return sum(
+        max(1, math.ceil(len(piece) / CHARS_PER_TOKEN_PIECE)) for piece in _TOKEN_RE.findall(text)
+    )
+
+def _dehyphenate(text: str) -> str:
+    def join(match):
+        if match.group(2).lower() in _COORDINATING_WORDS:
+            return match.group(0)
+        return match.group(1) + match.group(2)
+    return _HYPHENATION_RE.sub(join, text)
+
+def _edge_positions(page: List[str]) -> Set[int]:
+    """Indexes of the first and last PAGE_EDGE_LINES non-blank lines of a page"""
+    filled = [index for index, line in enumerate(page) if line]
+    return set(filled[:PAGE_EDGE_LINES] + filled[-PAGE_EDGE_LINES:])
+
+def _drop_page_furniture(pages: List[List[str]]) -> List[str]:
+    """Drop page numbers, registration footers and headers/footers repeated across pages
+
+    Repeats are found by position, not by count: identical rows in the body
+    of a form or table are kept, only the top and bottom of pages are compared.
+    """
+    pages = [
+        [line for line in page if not (line and (_PAGE_NUMBER_RE.match(line) or _BOILERPLATE_RE.match(line)))]
+        for page in pages
+    ]
+    edges = [_edge_positions(page) for page in pages]
+    counts = Counter()
+    for page, positions in zip(pages, edges):
+        counts.update({page[index] for index in positions})
+
+    seen = set()
+    kept = []
+    for page, positions in zip(pages, edges):
+        for index, line in enumerate(page):
+            if index in positions and counts[line] >= PAGE_FURNITURE_MIN_PAGES:
+                # Keep the first occurrence: it is usually the sender's letterhead
+                if line in seen:
+                    continue
+                seen.add(line)
+            kept.append(line)
+    return kept
+
+def normalize_letter_text(text: str) -> str:
+    """Clean OCR noise and repeated page furniture from a letter"""
+    text = unicodedata.normalize("NFC", text).translate(_CHARACTER_FIXES)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+    # PDF text separates pages with form feeds
+    pages = [
+        [re.sub(r"[ \t]+", " ", line).strip() for line in _dehyphenate(page).split("\n")]
+        for page in text.split("\f")
+    ]
+    lines = _drop_page_furniture(pages)
+
+    # At most one blank line between paragraphs
+    text = "\n".join(lines)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+def fit_to_token_budget(text: str, max_tokens: int) -> str:
+    """Shorten text to about max_tokens, keeping the start and the end of the letter
+
+    The subject, reference numbers and deadlines are usually near the top,
+    and payment details and signatures near the bottom, so the middle goes.
+    """
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    budget = max(0, max_tokens - estimate_tokens(TRUNCATION_MARKER))
+    lines = text.split("\n")
+    head, tail = [], []
+    head_budget = int(budget * 2 / 3)
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > head_budget:
+            break
+        head.append(line)
+        used += cost
+    for line in reversed(lines[len(head):]):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        tail.append(line)
+        used += cost
+
+    if not head and not tail:
+        # A single huge line (or no room beside the marker); fall back to characters
+        chars = budget * CHARS_PER_TOKEN_PIECE // 2
+        if chars <= 0:
+            return text[:max_tokens * CHARS_PER_TOKEN_PIECE]
+        return text[:chars] + TRUNCATION_MARKER + text[-chars:]
+    return "\n".join(head) + TRUNCATION_MARKER + "\n".join(reversed(tail))